@@ -203,8 +203,8 @@ async def update_rpa_flow(
     for key, value in update_data.items():
         setattr(flow, key, value)
     
-    # 如果更新了节点，增加版本号
-    if flow_data.nodes:
+    # 如果更新了节点（包括清空节点），增加版本号，引擎按版本号缓存执行计划
+    if "nodes" in update_data:
         flow.version += 1
     
     db.commit()
@@ -272,14 +272,24 @@ async def execute_task(
             detail="Task cannot be executed"
         )
     
+    if not task_scheduler.is_running:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Task scheduler is not running"
+        )
+    
+    # 重新执行的任务回到待执行状态（排队期间被取消的任务会在执行前跳过）
+    task.status = "pending"
+    db.commit()
+    
     success = await task_scheduler.execute_task(task_id)
     
     if success:
         return {"message": "Task execution started"}
     else:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Cannot start task execution (max concurrent tasks reached)"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Task is already running or queued"
         )
 
 
@@ -302,10 +312,10 @@ async def cancel_task(
             detail="Task not found"
         )
     
-    if task.status != "running":
+    if task.status not in ["running", "queued"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Task is not running"
+            detail="Task is not running or queued"
         )
     
     success = await task_scheduler.cancel_task(task_id)
@@ -344,6 +354,12 @@ async def retry_task(
             detail="Task cannot be retried"
         )
     
+    if not task_scheduler.is_running:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Task scheduler is not running"
+        )
+    
     success = await task_scheduler.retry_task(task_id)
     
     if success:
@@ -385,9 +401,12 @@ async def get_running_tasks_status(
     """获取正在运行的任务状态"""
     
     running_task_ids = task_scheduler.get_running_tasks()
+    queued_task_ids = task_scheduler.get_queued_tasks()
     
     return {
         "running_count": len(running_task_ids),
+        "queued_count": len(queued_task_ids),
         "max_concurrent": task_scheduler.max_concurrent_tasks,
-        "running_task_ids": running_task_ids
+        "running_task_ids": running_task_ids,
+        "queued_task_ids": queued_task_ids
     }
@@ -1,10 +1,14 @@
 """
 数据库连接和会话管理
 """
+from contextlib import AsyncExitStack
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
 from app.core.config import settings
 
@@ -27,9 +31,32 @@ else:
         echo=settings.LOG_LEVEL == "DEBUG",
     )
 
+# 异步连接池常驻连接数
+ASYNC_POOL_SIZE = 20
+
+# 创建异步数据库引擎（进程内共用，供后台任务调度使用，避免阻塞事件循环）
+if settings.TESTING:
+    async_engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        poolclass=StaticPool,
+        echo=True,
+    )
+else:
+    async_engine = create_async_engine(
+        make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(drivername="postgresql+asyncpg"),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=True,
+        pool_size=ASYNC_POOL_SIZE,
+        max_overflow=10,
+        echo=settings.LOG_LEVEL == "DEBUG",
+    )
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步会话工厂（提交后不过期对象，避免在协程中触发隐式懒加载）
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建基础模型类
 Base = declarative_base()
 
@@ -46,6 +73,13 @@ def get_db():
         db.close()
 
 
+async def prewarm_async_pool(size: int = ASYNC_POOL_SIZE):
+    """预先建立异步连接池中的常驻连接，避免首批任务并发执行时临时建连"""
+    async with AsyncExitStack() as stack:
+        for _ in range(size):
+            await stack.enter_async_context(async_engine.connect())
+
+
 def create_tables():
     """创建所有表"""
     Base.metadata.create_all(bind=engine)
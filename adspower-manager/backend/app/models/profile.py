@@ -1,7 +1,7 @@
 """
 浏览器环境配置模型
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, ARRAY
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, ARRAY, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -12,6 +12,10 @@ from app.core.database import Base
 class Profile(Base):
     """浏览器环境配置表"""
     __tablename__ = "profiles"
+    __table_args__ = (
+        # get_profile_by_id 按 (user_id, id) 查询，复合索引一次定位
+        Index("ix_profiles_user_id_id", "user_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -1,6 +1,8 @@
 """
 任务执行模型
 """
+from datetime import datetime, timezone
+
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
@@ -24,7 +26,7 @@ class Task(Base):
     
     # 执行状态
     status = Column(String(20), default="pending", nullable=False, index=True)
-    # pending, running, completed, failed, cancelled, paused
+    # pending, queued（定时任务已被调度器认领）, running, completed, failed, cancelled, paused
     
     progress = Column(Integer, default=0)  # 进度百分比 0-100
     current_node_index = Column(Integer, default=0)  # 当前执行节点索引
@@ -148,7 +150,9 @@ class Task(Base):
         if error:
             self.error_message = error
         
-        # 计算执行时长
-        if self.started_at:
-            duration = (func.now() - self.started_at).total_seconds()
-            self.duration = duration
+        # 计算执行时长（started_at 尚未从数据库加载时仍是SQL表达式，跳过）
+        if isinstance(self.started_at, datetime):
+            started_at = self.started_at
+            if started_at.tzinfo is None:
+                started_at = started_at.replace(tzinfo=timezone.utc)
+            self.duration = (datetime.now(timezone.utc) - started_at).total_seconds()
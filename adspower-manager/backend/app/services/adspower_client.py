@@ -32,15 +32,31 @@ class AdsPowerClient:
         
     async def __aenter__(self):
         """异步上下文管理器入口"""
-        self.session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.timeout)
-        )
+        await self._get_session()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """异步上下文管理器出口"""
-        if self.session:
+        """异步上下文管理器出口
+        
+        会话为所有调用方共享的长连接，不在这里关闭，由应用关闭时调用 close() 释放。
+        """
+        pass
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话，不存在或已关闭时重新创建"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                # 复用到本地API的TCP连接，避免每次调用重新建连
+                connector=aiohttp.TCPConnector(limit=50, keepalive_timeout=60)
+            )
+        return self.session
+    
+    async def close(self):
+        """关闭共享会话"""
+        if self.session and not self.session.closed:
             await self.session.close()
+        self.session = None
     
     async def _request(
         self, 
@@ -51,8 +67,7 @@ class AdsPowerClient:
         retries: int = 3
     ) -> Dict:
         """发送HTTP请求"""
-        if not self.session:
-            raise AdsPowerAPIError("Client session not initialized")
+        session = await self._get_session()
             
         url = urljoin(self.base_url, endpoint)
         
@@ -66,7 +81,7 @@ class AdsPowerClient:
                     attempt=attempt + 1
                 )
                 
-                async with self.session.request(
+                async with session.request(
                     method=method,
                     url=url,
                     params=params,
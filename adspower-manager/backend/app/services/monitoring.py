@@ -9,9 +9,13 @@ from datetime import datetime, timedelta
 from enum import Enum
 import structlog
 from dataclasses import dataclass
+from sqlalchemy import text
 
 from app.core.config import settings
 from app.core.cache import cache
+from app.core.database import engine
+from app.services.adspower_client import adspower_client
+from app.services.task_scheduler import task_scheduler
 from app.services.websocket_manager import connection_manager
 
 logger = structlog.get_logger()
@@ -47,21 +51,15 @@ class MetricCollector:
         self.last_collection = time.time()
     
     async def collect_system_metrics(self) -> Dict[str, Any]:
-        """收集系统指标"""
+        """收集变化快的系统指标（CPU、内存、进程）"""
         try:
-            # CPU指标
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU指标（非阻塞，返回距上次调用的平均值）
+            cpu_percent = psutil.cpu_percent(interval=None)
             cpu_count = psutil.cpu_count()
             
             # 内存指标
             memory = psutil.virtual_memory()
             
-            # 磁盘指标
-            disk = psutil.disk_usage('/')
-            
-            # 网络指标
-            network = psutil.net_io_counters()
-            
             # 进程指标
             process = psutil.Process()
             process_memory = process.memory_info()
@@ -79,40 +77,59 @@ class MetricCollector:
                     "used": memory.used,
                     "usage_percent": memory.percent
                 },
+                "process": {
+                    "memory_rss": process_memory.rss,
+                    "memory_vms": process_memory.vms,
+                    "cpu_percent": process.cpu_percent()
+                }
+            }
+            
+            self.metrics.setdefault("system", {}).update(metrics)
+            self.last_collection = metrics["timestamp"]
+            return metrics
+            
+        except Exception as e:
+            logger.error("Failed to collect system metrics", error=str(e))
+            return {}
+    
+    async def collect_slow_system_metrics(self) -> Dict[str, Any]:
+        """收集变化慢的系统指标（磁盘、网络计数器）"""
+        try:
+            # 磁盘指标
+            disk = psutil.disk_usage('/')
+            
+            # 网络指标
+            network = psutil.net_io_counters()
+            
+            metrics = {
+                "slow_timestamp": time.time(),
                 "disk": {
                     "total": disk.total,
                     "used": disk.used,
                     "free": disk.free,
-                    "usage_percent": (disk.used / disk.total) * 100
+                    "usage_percent": disk.percent
                 },
                 "network": {
                     "bytes_sent": network.bytes_sent,
                     "bytes_recv": network.bytes_recv,
                     "packets_sent": network.packets_sent,
                     "packets_recv": network.packets_recv
-                },
-                "process": {
-                    "memory_rss": process_memory.rss,
-                    "memory_vms": process_memory.vms,
-                    "cpu_percent": process.cpu_percent()
                 }
             }
             
-            self.metrics["system"] = metrics
+            self.metrics.setdefault("system", {}).update(metrics)
             return metrics
             
         except Exception as e:
-            logger.error("Failed to collect system metrics", error=str(e))
+            logger.error("Failed to collect slow system metrics", error=str(e))
             return {}
     
     async def collect_application_metrics(self) -> Dict[str, Any]:
         """收集应用指标"""
         try:
-            from app.services.task_scheduler import task_scheduler
-            from app.services.websocket_manager import connection_manager
-            
             # 任务指标
             running_tasks = len(task_scheduler.get_running_tasks())
+            queued_tasks = len(task_scheduler.get_queued_tasks())
             
             # WebSocket连接指标
             ws_stats = connection_manager.get_connection_stats()
@@ -124,6 +141,7 @@ class MetricCollector:
                 "timestamp": time.time(),
                 "tasks": {
                     "running_count": running_tasks,
+                    "queued_count": queued_tasks,
                     "max_concurrent": task_scheduler.max_concurrent_tasks
                 },
                 "websocket": ws_stats,
@@ -140,8 +158,6 @@ class MetricCollector:
     async def collect_database_metrics(self) -> Dict[str, Any]:
         """收集数据库指标"""
         try:
-            from app.core.database import engine
-            
             # 数据库连接池信息
             pool = engine.pool
             
@@ -164,6 +180,16 @@ class MetricCollector:
             return {}
 
 
+def _get_metric_value(metrics: Dict[str, Any], path: tuple) -> Any:
+    """按路径读取嵌套指标值，缺失时返回0"""
+    value = metrics
+    for key in path:
+        value = value.get(key)
+        if value is None:
+            return 0
+    return value
+
+
 class AlertManager:
     """告警管理器"""
     
@@ -172,6 +198,8 @@ class AlertManager:
         self.alert_rules: List[Dict] = []
         self.notification_handlers: List[Callable] = []
         self.alert_history: List[Alert] = []
+        # 规则名 -> 上次触发时间（time.monotonic）
+        self._last_fired: Dict[str, float] = {}
         
         # 默认告警规则
         self._setup_default_rules()
@@ -181,7 +209,8 @@ class AlertManager:
         self.alert_rules = [
             {
                 "name": "high_cpu_usage",
-                "condition": lambda metrics: metrics.get("system", {}).get("cpu", {}).get("usage_percent", 0) > 80,
+                "metric": ("system", "cpu", "usage_percent"),
+                "threshold": 80,
                 "level": AlertLevel.WARNING,
                 "title": "CPU使用率过高",
                 "message": "CPU使用率超过80%",
@@ -189,7 +218,8 @@ class AlertManager:
             },
             {
                 "name": "high_memory_usage",
-                "condition": lambda metrics: metrics.get("system", {}).get("memory", {}).get("usage_percent", 0) > 85,
+                "metric": ("system", "memory", "usage_percent"),
+                "threshold": 85,
                 "level": AlertLevel.WARNING,
                 "title": "内存使用率过高",
                 "message": "内存使用率超过85%",
@@ -197,15 +227,18 @@ class AlertManager:
             },
             {
                 "name": "disk_space_low",
-                "condition": lambda metrics: metrics.get("system", {}).get("disk", {}).get("usage_percent", 0) > 90,
+                "metric": ("system", "disk", "usage_percent"),
+                "threshold": 90,
                 "level": AlertLevel.ERROR,
                 "title": "磁盘空间不足",
                 "message": "磁盘使用率超过90%",
-                "cooldown": 600  # 10分钟冷却期
+                "cooldown": 600,  # 10分钟冷却期
+                "slow": True
             },
             {
                 "name": "too_many_running_tasks",
-                "condition": lambda metrics: metrics.get("application", {}).get("tasks", {}).get("running_count", 0) > 50,
+                "metric": ("application", "tasks", "running_count"),
+                "threshold": 50,
                 "level": AlertLevel.WARNING,
                 "title": "运行任务过多",
                 "message": "当前运行任务数量超过50个",
@@ -213,56 +246,85 @@ class AlertManager:
             },
             {
                 "name": "database_connection_high",
-                "condition": lambda metrics: metrics.get("database", {}).get("connections", {}).get("checked_out", 0) > 15,
+                "metric": ("database", "connections", "checked_out"),
+                "threshold": 15,
                 "level": AlertLevel.WARNING,
                 "title": "数据库连接数过高",
                 "message": "数据库连接数超过15个",
-                "cooldown": 300
+                "cooldown": 300,
+                "slow": True
             }
         ]
     
     def add_alert_rule(self, rule: Dict):
-        """添加告警规则"""
-        required_fields = ["name", "condition", "level", "title", "message"]
+        """添加告警规则
+        
+        规则可以用 metric（指标路径元组）+ threshold 描述，也可以提供自定义 condition 函数；
+        依赖低频指标的规则需设置 slow=True，只在低频指标刷新后检查
+        """
+        required_fields = ["name", "level", "title", "message"]
         if not all(field in rule for field in required_fields):
             raise ValueError("Alert rule missing required fields")
         
+        has_threshold = "metric" in rule and "threshold" in rule
+        if not has_threshold and "condition" not in rule:
+            raise ValueError("Alert rule requires either metric/threshold or condition")
+        
+        if has_threshold:
+            rule["metric"] = tuple(rule["metric"])
+        
         self.alert_rules.append(rule)
     
     def add_notification_handler(self, handler: Callable):
         """添加通知处理器"""
         self.notification_handlers.append(handler)
     
-    async def check_alerts(self, metrics: Dict[str, Any]):
-        """检查告警条件"""
+    async def check_alerts(self, metrics: Dict[str, Any], slow: bool = False):
+        """检查告警条件
+        
+        slow 为 True 时只检查依赖低频指标的规则，否则只检查高频规则，
+        避免用未刷新的旧值反复判断
+        """
         current_time = datetime.utcnow()
+        current_ts = int(current_time.timestamp())
+        now_mono = time.monotonic()
         
         for rule in self.alert_rules:
+            if rule.get("slow", False) != slow:
+                continue
+            
             try:
                 # 检查冷却期
                 cooldown = rule.get("cooldown", 300)
-                last_alert_key = f"last_alert:{rule['name']}"
-                last_alert_time = cache.get(last_alert_key)
+                last_fired = self._last_fired.get(rule["name"])
                 
-                if last_alert_time and (current_time.timestamp() - last_alert_time) < cooldown:
+                if last_fired is not None and now_mono - last_fired < cooldown:
                     continue
                 
                 # 检查告警条件
-                if rule["condition"](metrics):
+                metric_path = rule.get("metric")
+                if metric_path is not None:
+                    value = _get_metric_value(metrics, metric_path)
+                    triggered = value > rule["threshold"]
+                else:
+                    value = None
+                    triggered = rule["condition"](metrics)
+                
+                if triggered:
                     alert = Alert(
-                        id=f"{rule['name']}_{int(current_time.timestamp())}",
+                        id=f"{rule['name']}_{current_ts}",
                         level=rule["level"],
                         title=rule["title"],
                         message=rule["message"],
                         source="system_monitor",
                         timestamp=current_time,
-                        metadata={"rule": rule["name"], "metrics": metrics}
+                        metadata=self._build_alert_metadata(rule, value)
                     )
                     
                     await self._trigger_alert(alert)
                     
                     # 设置冷却期
-                    cache.set(last_alert_key, current_time.timestamp(), cooldown)
+                    self._last_fired[rule["name"]] = now_mono
                     
             except Exception as e:
                 logger.error(
@@ -271,6 +333,18 @@ class AlertManager:
                     error=str(e)
                 )
     
+    def _build_alert_metadata(self, rule: Dict, value: Any) -> Dict[str, Any]:
+        """构建告警元数据（只记录触发指标，不保存整份指标快照）"""
+        metadata = {"rule": rule["name"]}
+        
+        metric_path = rule.get("metric")
+        if metric_path is not None:
+            metadata["metric"] = ".".join(metric_path)
+            metadata["value"] = value
+            metadata["threshold"] = rule["threshold"]
+        
+        return metadata
+    
     async def _trigger_alert(self, alert: Alert):
         """触发告警"""
         self.alerts.append(alert)
@@ -365,35 +439,39 @@ class HealthChecker:
         """注册健康检查"""
         self.health_checks[name] = check_func
     
+    async def _run_health_check(self, check_func: Callable) -> Dict[str, Any]:
+        """运行单个健康检查"""
+        try:
+            start_time = time.time()
+            result = await check_func() if asyncio.iscoroutinefunction(check_func) else check_func()
+            duration = time.time() - start_time
+            
+            return {
+                "healthy": result.get("healthy", True),
+                "message": result.get("message", "OK"),
+                "duration": duration,
+                "timestamp": time.time()
+            }
+            
+        except Exception as e:
+            return {
+                "healthy": False,
+                "message": f"Health check failed: {str(e)}",
+                "duration": 0,
+                "timestamp": time.time()
+            }
+    
     async def run_health_checks(self) -> Dict[str, Any]:
         """运行所有健康检查"""
-        results = {}
-        overall_healthy = True
+        # 各项检查互不依赖，并发执行
+        names = list(self.health_checks.keys())
+        check_results = await asyncio.gather(*(
+            self._run_health_check(check_func)
+            for check_func in self.health_checks.values()
+        ))
         
-        for name, check_func in self.health_checks.items():
-            try:
-                start_time = time.time()
-                result = await check_func() if asyncio.iscoroutinefunction(check_func) else check_func()
-                duration = time.time() - start_time
-                
-                results[name] = {
-                    "healthy": result.get("healthy", True),
-                    "message": result.get("message", "OK"),
-                    "duration": duration,
-                    "timestamp": time.time()
-                }
-                
-                if not results[name]["healthy"]:
-                    overall_healthy = False
-                    
-            except Exception as e:
-                results[name] = {
-                    "healthy": False,
-                    "message": f"Health check failed: {str(e)}",
-                    "duration": 0,
-                    "timestamp": time.time()
-                }
-                overall_healthy = False
+        results = dict(zip(names, check_results))
+        overall_healthy = all(result["healthy"] for result in check_results)
         
         self.last_check_results = results
         
@@ -410,6 +488,53 @@ alert_manager = AlertManager()
 health_checker = HealthChecker()
 
 
+# 指标采集周期（秒）：变化快的指标高频采集，变化慢的指标低频采集
+FAST_METRICS_INTERVAL = 15
+SLOW_METRICS_INTERVAL = 300
+HEALTH_CHECK_INTERVAL = 300
+
+
+async def _fast_metrics_loop():
+    """高频指标采集：CPU、内存、任务数，并检查告警"""
+    while True:
+        try:
+            await metric_collector.collect_system_metrics()
+            await metric_collector.collect_application_metrics()
+            
+            # 检查高频指标的告警
+            await alert_manager.check_alerts(metric_collector.metrics)
+        except Exception as e:
+            logger.error("Monitoring error", error=str(e))
+        
+        await asyncio.sleep(FAST_METRICS_INTERVAL)
+
+
+async def _slow_metrics_loop():
+    """低频指标采集：磁盘、网络计数器、数据库连接池，并检查相应告警"""
+    while True:
+        try:
+            await metric_collector.collect_slow_system_metrics()
+            await metric_collector.collect_database_metrics()
+            
+            # 低频指标只在刷新后检查告警
+            await alert_manager.check_alerts(metric_collector.metrics, slow=True)
+        except Exception as e:
+            logger.error("Monitoring error", error=str(e))
+        
+        await asyncio.sleep(SLOW_METRICS_INTERVAL)
+
+
+async def _health_check_loop():
+    """定期健康检查"""
+    while True:
+        try:
+            await health_checker.run_health_checks()
+        except Exception as e:
+            logger.error("Health check error", error=str(e))
+        
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+
 async def start_monitoring():
     """启动监控系统"""
     logger.info("Starting monitoring system")
@@ -419,56 +544,44 @@ async def start_monitoring():
     health_checker.register_health_check("cache", check_cache_health)
     health_checker.register_health_check("adspower", check_adspower_health)
     
-    while True:
-        try:
-            # 收集指标
-            system_metrics = await metric_collector.collect_system_metrics()
-            app_metrics = await metric_collector.collect_application_metrics()
-            db_metrics = await metric_collector.collect_database_metrics()
-            
-            all_metrics = {
-                "system": system_metrics,
-                "application": app_metrics,
-                "database": db_metrics
-            }
-            
-            # 检查告警
-            await alert_manager.check_alerts(all_metrics)
-            
-            # 运行健康检查（每5分钟一次）
-            if int(time.time()) % 300 == 0:
-                await health_checker.run_health_checks()
-            
-            await asyncio.sleep(60)  # 每分钟收集一次指标
-            
-        except Exception as e:
-            logger.error("Monitoring error", error=str(e))
-            await asyncio.sleep(60)
+    await asyncio.gather(
+        _fast_metrics_loop(),
+        _slow_metrics_loop(),
+        _health_check_loop(),
+    )
+
+
+def _probe_database():
+    """通过同步连接池执行一次查询"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
 
 
 async def check_database_health() -> Dict[str, Any]:
     """数据库健康检查"""
     try:
-        from app.core.database import SessionLocal
-        
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
+        # 同步驱动会阻塞事件循环，放到线程中执行，与其他检查真正并发
+        await asyncio.to_thread(_probe_database)
         
         return {"healthy": True, "message": "Database connection OK"}
     except Exception as e:
         return {"healthy": False, "message": f"Database error: {str(e)}"}
 
 
+def _probe_cache() -> bool:
+    """写入、读取并删除一个测试键"""
+    test_key = "health_check_test"
+    cache.set(test_key, "test_value", 10)
+    value = cache.get(test_key)
+    cache.delete(test_key)
+    return value == "test_value"
+
+
 async def check_cache_health() -> Dict[str, Any]:
     """缓存健康检查"""
     try:
-        test_key = "health_check_test"
-        cache.set(test_key, "test_value", 10)
-        value = cache.get(test_key)
-        cache.delete(test_key)
-        
-        if value == "test_value":
+        # Redis客户端是同步的，放到线程中执行
+        if await asyncio.to_thread(_probe_cache):
             return {"healthy": True, "message": "Cache OK"}
         else:
             return {"healthy": False, "message": "Cache read/write failed"}
@@ -476,17 +589,29 @@ async def check_cache_health() -> Dict[str, Any]:
         return {"healthy": False, "message": f"Cache error: {str(e)}"}
 
 
+# AdsPower健康检查结果缓存（秒）
+ADSPOWER_HEALTH_TTL = 30
+_adspower_health_cache: Dict[str, Any] = {"checked_at": 0.0, "result": None}
+
+
 async def check_adspower_health() -> Dict[str, Any]:
     """AdsPower健康检查"""
+    now = time.monotonic()
+    cached_result = _adspower_health_cache["result"]
+    if cached_result is not None and now - _adspower_health_cache["checked_at"] < ADSPOWER_HEALTH_TTL:
+        return cached_result
+    
     try:
-        from app.services.adspower_client import adspower_client
+        # 共享客户端的会话常驻，直接调用即可
+        healthy = await adspower_client.health_check()
         
-        async with adspower_client as client:
-            healthy = await client.health_check()
-            
         if healthy:
-            return {"healthy": True, "message": "AdsPower API OK"}
+            result = {"healthy": True, "message": "AdsPower API OK"}
         else:
-            return {"healthy": False, "message": "AdsPower API not responding"}
+            result = {"healthy": False, "message": "AdsPower API not responding"}
     except Exception as e:
-        return {"healthy": False, "message": f"AdsPower error: {str(e)}"}
+        result = {"healthy": False, "message": f"AdsPower error: {str(e)}"}
+    
+    _adspower_health_cache["checked_at"] = now
+    _adspower_health_cache["result"] = result
+    return result
@@ -3,7 +3,7 @@
 """
 from typing import List, Dict, Optional, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, lambda_stmt, select
 import structlog
 
 from app.models.profile import Profile
@@ -196,9 +196,11 @@ class ProfileService:
     
     def get_profile_by_id(self, user_id: int, profile_id: int) -> Optional[Profile]:
         """根据ID获取环境"""
-        return self.db.query(Profile).filter(
-            and_(Profile.id == profile_id, Profile.user_id == user_id)
-        ).first()
+        # lambda_stmt 缓存编译后的SQL，profile_id/user_id 作为绑定参数传入
+        stmt = lambda_stmt(
+            lambda: select(Profile).where(Profile.id == profile_id, Profile.user_id == user_id)
+        )
+        return self.db.scalar(stmt)
     
     def get_profile_by_adspower_id(self, adspower_id: str) -> Optional[Profile]:
         """根据AdsPower ID获取环境"""
@@ -264,7 +266,7 @@ class ProfileService:
         try:
             # 先停止浏览器（如果正在运行）
             if profile.status == "running":
-                await self.stop_browser(user_id, profile_id)
+                await self.stop_browser(user_id, profile_id, profile=profile)
             
             # 调用AdsPower API删除
             async with adspower_client as client:
@@ -332,10 +334,14 @@ class ProfileService:
             logger.error("Failed to start browser", error=str(e), profile_id=profile_id)
             raise
     
-    async def stop_browser(self, user_id: int, profile_id: int) -> bool:
-        """关闭浏览器"""
+    async def stop_browser(self, user_id: int, profile_id: int, profile: Profile = None) -> bool:
+        """关闭浏览器
         
-        profile = self.get_profile_by_id(user_id, profile_id)
+        调用方已加载profile时可直接传入，避免重复查询
+        """
+        
+        if profile is None:
+            profile = self.get_profile_by_id(user_id, profile_id)
         if not profile:
             raise ValueError("Profile not found")
         
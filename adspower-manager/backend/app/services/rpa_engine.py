@@ -2,18 +2,161 @@
 RPA执行引擎
 """
 import asyncio
-import json
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+import os
+import random
+import re
+import sys
+import time
+from collections import ChainMap, deque
+from contextvars import ContextVar
+from functools import lru_cache
+from operator import methodcaller
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Optional, Tuple
+from datetime import date, datetime, time as datetime_time, timedelta
+import orjson
 import structlog
 
 from app.services.adspower_client import adspower_client
+from app.services.websocket_manager import task_notifier
 from app.models.task import Task
 from app.models.profile import Profile
 from app.models.rpa import RPAFlow
 
 logger = structlog.get_logger()
 
+# 正在执行的节点下标；并发组中的节点各自运行在独立的任务中，互不影响
+_current_node_index: ContextVar[Optional[int]] = ContextVar("rpa_current_node_index", default=None)
+
+# 是否模拟节点执行延迟，默认关闭
+_SIMULATE_DELAYS = os.getenv("RPA_SIMULATE_DELAYS", "0") == "1"
+
+
+# 单次执行保留的日志条数上限
+RPA_LOG_CAP = int(os.getenv("RPA_LOG_CAP", "10000"))
+
+# UTC纪元，用于把 time_ns() 转换为与 datetime.utcnow() 相同格式的时间
+_EPOCH = datetime(1970, 1, 1)
+
+# 变量占位符 ${variable_name}
+_VAR_RE = re.compile(r'\$\{([^}]+)\}')
+
+
+@lru_cache(maxsize=4096)
+def _parse_template(text: str) -> tuple:
+    """解析模板为 (字面量, 变量名) 片段，同一字符串只解析一次"""
+    segments = []
+    pos = 0
+    for match in _VAR_RE.finditer(text):
+        segments.append((text[pos:match.start()], match.group(1)))
+        pos = match.end()
+    segments.append((text[pos:], None))
+    return tuple(segments)
+
+
+def _format_string(text: str) -> Optional[str]:
+    """变量名都是普通标识符时，将模板转换为 str.format_map 格式串，否则返回None"""
+    parts = []
+    for literal, var_name in _parse_template(text):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if var_name is not None:
+            if not var_name.isidentifier():
+                return None
+            parts.append("{%s}" % var_name)
+    return "".join(parts)
+
+
+class _VariableLookup:
+    """format_map 使用的变量视图，未定义的变量保留原占位符"""
+    
+    __slots__ = ("variables",)
+    
+    def __init__(self, variables):
+        self.variables = variables
+    
+    def __getitem__(self, name):
+        try:
+            return self.variables[name]
+        except KeyError:
+            return "${%s}" % name
+
+
+@lru_cache(maxsize=4096)
+def _compile_template(text: str):
+    """将模板编译为渲染函数 render(variables) -> str，同一字符串只编译一次"""
+    format_string = _format_string(text)
+    if format_string is not None:
+        def render(variables):
+            return format_string.format_map(_VariableLookup(variables))
+        return render
+    
+    segments = _parse_template(text)
+    
+    def render(variables):
+        parts = []
+        for literal, var_name in segments:
+            parts.append(literal)
+            if var_name is not None:
+                parts.append(str(variables.get(var_name, "${%s}" % var_name)))
+        return "".join(parts)
+    return render
+
+
+@lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> "re.Pattern":
+    """编译用户提供的正则，循环节点中同一模式只编译一次"""
+    return re.compile(pattern)
+
+
+def _to_number(value) -> float:
+    """数值比较的操作数，已是数字时不再转换"""
+    return value if isinstance(value, (int, float)) else float(value)
+
+
+def _numeric_compare(compare):
+    def evaluate(left, right):
+        try:
+            return compare(_to_number(left), _to_number(right))
+        except (TypeError, ValueError):
+            return False
+    return evaluate
+
+
+# 条件节点支持的比较运算符
+_CMP_OPS = {
+    "equals": lambda left, right: str(left) == str(right),
+    "not_equals": lambda left, right: str(left) != str(right),
+    "contains": lambda left, right: str(right) in str(left),
+    "greater_than": _numeric_compare(lambda left, right: left > right),
+    "less_than": _numeric_compare(lambda left, right: left < right),
+}
+
+
+def _collect_variable_refs(value: Any, refs: set) -> set:
+    """收集配置中 ${...} 引用的变量名"""
+    if isinstance(value, str):
+        if "${" in value:
+            refs.update(var_name for _, var_name in _parse_template(value) if var_name is not None)
+    elif isinstance(value, (dict, MappingProxyType)):
+        for item in value.values():
+            _collect_variable_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_variable_refs(item, refs)
+    return refs
+
+
+def _freeze_nodes(nodes: List[Dict]) -> List[Dict]:
+    """流程开始时将节点配置转为只读视图，并发执行的节点可安全共享同一配置"""
+    frozen = []
+    for node in nodes:
+        config = node.get("config") or {}
+        frozen.append({
+            **node,
+            "config": MappingProxyType({sys.intern(key): value for key, value in config.items()})
+        })
+    return frozen
+
 
 class RPANodeError(Exception):
     """RPA节点执行异常"""
@@ -24,17 +167,62 @@ class RPANodeError(Exception):
         super().__init__(self.message)
 
 
+def _render_log_message(entry: Dict) -> str:
+    """拼接日志文本"""
+    return entry["message"] % entry["args"] if entry["args"] else entry["message"]
+
+
+def _format_log_entry(entry: Dict) -> Dict:
+    """将日志转换为可持久化的格式（ISO时间戳）"""
+    return {
+        "timestamp": (_EPOCH + timedelta(microseconds=entry["timestamp_ns"] // 1000)).isoformat(),
+        "level": entry["level"],
+        "message": _render_log_message(entry),
+        "node_index": entry["node_index"]
+    }
+
+
 class RPAExecutionContext:
     """RPA执行上下文"""
     
+    __slots__ = (
+        "task", "profile", "rpa_flow", "variables", "browser_data",
+        "current_node_index", "execution_logs", "log_queue", "rng", "engine", "adspower"
+    )
+    
     def __init__(self, task: Task, profile: Profile, rpa_flow: RPAFlow):
+        # 日志条数有上限，长时间循环时自动丢弃最早的记录
+        self.execution_logs = deque(maxlen=RPA_LOG_CAP)
+        # 每个流程独立的随机数生成器
+        self.rng = random.Random()
+        self.reset(task, profile, rpa_flow)
+    
+    def reset(self, task: Task, profile: Profile, rpa_flow: RPAFlow):
+        """为新任务重置上下文，复用已分配的日志缓冲区和随机数生成器"""
         self.task = task
         self.profile = profile
         self.rpa_flow = rpa_flow
-        self.variables = task.variables.copy() if task.variables else {}
+        # 流程写入的变量在上层，读取时回落到任务变量，无需复制任务变量
+        self.variables = ChainMap({}, task.variables or {})
         self.browser_data = None
         self.current_node_index = 0
-        self.execution_logs = []
+        self.execution_logs.clear()
+        # 待输出的日志队列，执行流程期间由引擎创建
+        self.log_queue: Optional[asyncio.Queue] = None
+        self.rng.seed()
+        # 执行该上下文的引擎及AdsPower客户端，由 execute_flow 设置
+        self.engine = None
+        self.adspower = None
+    
+    def release(self):
+        """释放对任务数据的引用，以便上下文放回对象池"""
+        self.task = self.profile = self.rpa_flow = None
+        self.variables = None
+        self.browser_data = None
+        self.execution_logs.clear()
+        self.log_queue = None
+        self.engine = None
+        self.adspower = None
         
     def set_variable(self, name: str, value: Any):
         """设置变量"""
@@ -44,28 +232,77 @@ class RPAExecutionContext:
         """获取变量"""
         return self.variables.get(name, default)
         
-    def add_log(self, level: str, message: str, node_index: int = None):
-        """添加日志"""
+    def add_log(self, level: str, message: str, *args, node_index: int = None):
+        """添加日志
+        
+        message 支持 %-格式化参数，文本在持久化或输出时才拼接。
+        未指定 node_index 时记录当前任务中正在执行的节点。
+        """
+        if node_index is None:
+            node_index = _current_node_index.get()
+            if node_index is None:
+                node_index = self.current_node_index
+        
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # 记录纳秒时间戳，序列化时再格式化
+            "timestamp_ns": time.time_ns(),
             "level": level,
             "message": message,
-            "node_index": node_index or self.current_node_index
+            "args": args,
+            "node_index": node_index
         }
         self.execution_logs.append(log_entry)
         
-        logger.info(
-            "RPA execution log",
-            task_id=self.task.id,
-            level=level,
-            message=message,
-            node_index=node_index
-        )
+        # 由引擎的后台任务批量输出到structlog，不在执行路径上格式化
+        if self.log_queue is not None:
+            self.log_queue.put_nowait(log_entry)
+    
+    def format_logs(self) -> List[Dict]:
+        """将日志转换为可持久化的格式（ISO时间戳）"""
+        return [_format_log_entry(entry) for entry in self.execution_logs]
+
+
+class ExecutionContextPool:
+    """执行上下文对象池，复用上下文及其日志缓冲区"""
+    
+    def __init__(self, size: int = 16):
+        self.size = size
+        self._free: List[RPAExecutionContext] = []
+    
+    def acquire(self, task: Task, profile: Profile, rpa_flow: RPAFlow) -> RPAExecutionContext:
+        """取出一个上下文并为任务重置（池为空时新建）"""
+        # 事件循环单线程执行，列表的 pop/append 之间不会被其他协程打断
+        if self._free:
+            context = self._free.pop()
+            context.reset(task, profile, rpa_flow)
+            return context
+        return RPAExecutionContext(task, profile, rpa_flow)
+    
+    def release(self, context: RPAExecutionContext):
+        """归还上下文，超出池容量的直接丢弃"""
+        context.release()
+        if len(self._free) < self.size:
+            self._free.append(context)
+
+
+# 全局执行上下文池
+context_pool = ExecutionContextPool()
 
 
 class RPANodeHandler:
     """RPA节点处理器基类"""
     
+    __slots__ = ("node_type",)
+    
+    # 不操作浏览器页面的节点，可与相邻的同类节点并发执行
+    parallel_safe = False
+    # 节点写入的默认变量名
+    default_variable = None
+    # 配置校验规则：必填字段、至少填写其一的字段、字段类型
+    required_fields = frozenset()
+    any_of_fields = frozenset()
+    field_types = {}
+    
     def __init__(self, node_type: str):
         self.node_type = node_type
     
@@ -74,27 +311,38 @@ class RPANodeHandler:
         raise NotImplementedError
     
     def validate_config(self, config: Dict) -> bool:
-        """验证配置"""
+        """验证配置：必填字段、至少填写其一的字段以及字段类型"""
+        keys = config.keys()
+        if not keys >= self.required_fields:
+            return False
+        if self.any_of_fields and keys.isdisjoint(self.any_of_fields):
+            return False
+        for field, field_type in self.field_types.items():
+            if field in config and not isinstance(config[field], field_type):
+                return False
         return True
     
+    def prepare_config(self, config: Mapping) -> Mapping:
+        """生成执行计划时对配置做一次性预处理，返回执行时使用的配置"""
+        return config
+    
+    def output_variables(self, config: Dict) -> set:
+        """节点会写入的变量名"""
+        var_name = config.get("variable", self.default_variable)
+        return {var_name} if var_name else set()
+    
     def substitute_variables(self, text: str, context: RPAExecutionContext) -> str:
         """替换变量占位符"""
-        if not isinstance(text, str):
+        if not isinstance(text, str) or "${" not in text:
             return text
-            
-        # 简单的变量替换 ${variable_name}
-        import re
-        pattern = r'\$\{([^}]+)\}'
         
-        def replace_var(match):
-            var_name = match.group(1)
-            return str(context.get_variable(var_name, match.group(0)))
-        
-        return re.sub(pattern, replace_var, text)
+        return _compile_template(text)(context.variables)
 
 
 class NewPageHandler(RPANodeHandler):
     """新建标签页处理器"""
+
+    __slots__ = ()
     
     def __init__(self):
         super().__init__("newPage")
@@ -111,84 +359,104 @@ class NewPageHandler(RPANodeHandler):
 
 class GotoUrlHandler(RPANodeHandler):
     """访问网址处理器"""
+
+    __slots__ = ()
+
+    required_fields = frozenset({"url"})
     
     def __init__(self):
         super().__init__("gotoUrl")
     
-    def validate_config(self, config: Dict) -> bool:
-        return "url" in config
-    
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         """执行访问网址"""
         url = self.substitute_variables(config["url"], context)
         timeout = config.get("timeout", 30000)
         
-        context.add_log("info", f"Navigating to URL: {url}")
+        context.add_log("info", "Navigating to URL: %s", url)
         
         # 这里应该调用浏览器API访问URL
         # 由于AdsPower API限制，这里只是模拟
         
-        await asyncio.sleep(1)  # 模拟网页加载时间
+        await context.engine.sim_sleep(1)  # 模拟网页加载时间
         
         return {"success": True, "url": url, "message": f"Navigated to {url}"}
 
 
 class ClickHandler(RPANodeHandler):
     """点击处理器"""
+
+    __slots__ = ()
+
+    required_fields = frozenset({"selector"})
     
     def __init__(self):
         super().__init__("click")
     
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config
-    
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         """执行点击"""
         selector = self.substitute_variables(config["selector"], context)
         serial = config.get("serial", False)
         
-        context.add_log("info", f"Clicking element: {selector}")
+        context.add_log("info", "Clicking element: %s", selector)
         
         # 这里应该调用浏览器API点击元素
         # 由于AdsPower API限制，这里只是模拟
         
-        await asyncio.sleep(0.5)  # 模拟点击延迟
+        await context.engine.sim_sleep(0.5)  # 模拟点击延迟
         
         return {"success": True, "selector": selector, "message": f"Clicked {selector}"}
 
 
 class InputHandler(RPANodeHandler):
     """输入处理器"""
+
+    __slots__ = ()
+
+    required_fields = frozenset({"selector", "text"})
     
     def __init__(self):
         super().__init__("input")
     
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config and "text" in config
-    
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         """执行输入"""
         selector = self.substitute_variables(config["selector"], context)
         text = self.substitute_variables(config["text"], context)
         
-        context.add_log("info", f"Inputting text to {selector}: {text[:50]}...")
+        context.add_log("info", "Inputting text to %s: %.50s...", selector, text)
         
         # 这里应该调用浏览器API输入文本
         # 由于AdsPower API限制，这里只是模拟
         
-        await asyncio.sleep(0.3)  # 模拟输入延迟
+        await context.engine.sim_sleep(0.3)  # 模拟输入延迟
         
         return {"success": True, "selector": selector, "text": text, "message": f"Input text to {selector}"}
 
 
 class WaitTimeHandler(RPANodeHandler):
     """等待时间处理器"""
+
+    __slots__ = ()
+
+    any_of_fields = frozenset({"timeout", "timeoutType"})
     
     def __init__(self):
         super().__init__("waitTime")
     
     def validate_config(self, config: Dict) -> bool:
-        return "timeout" in config or "timeoutType" in config
+        if not super().validate_config(config):
+            return False
+        
+        # 随机区间在生成执行计划时校验一次，执行时不再检查
+        if config.get("timeoutType", "fixed") == "randomInterval":
+            timeout_min = config.get("timeoutMin", 1000)
+            timeout_max = config.get("timeoutMax", 3000)
+            return (
+                isinstance(timeout_min, int) and isinstance(timeout_max, int)
+                and 0 <= timeout_min <= timeout_max
+            )
+        
+        timeout = config.get("timeout", 1000)
+        return isinstance(timeout, (int, float)) and timeout >= 0
     
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         """执行等待"""
@@ -197,16 +465,16 @@ class WaitTimeHandler(RPANodeHandler):
         if timeout_type == "fixed":
             timeout = config.get("timeout", 1000)
         elif timeout_type == "randomInterval":
-            import random
             timeout_min = config.get("timeoutMin", 1000)
             timeout_max = config.get("timeoutMax", 3000)
-            timeout = random.randint(timeout_min, timeout_max)
+            timeout = context.rng.randrange(timeout_min, timeout_max + 1)
         else:
             timeout = config.get("timeout", 1000)
         
         wait_seconds = timeout / 1000
-        context.add_log("info", f"Waiting for {wait_seconds} seconds")
+        context.add_log("info", "Waiting for %s seconds", wait_seconds)
         
+        # 用户配置的等待时间属于流程本身的节奏控制，不受模拟开关影响
         await asyncio.sleep(wait_seconds)
         
         return {"success": True, "timeout": timeout, "message": f"Waited {wait_seconds} seconds"}
@@ -215,19 +483,20 @@ class WaitTimeHandler(RPANodeHandler):
 class SetVariableHandler(RPANodeHandler):
     """设置变量处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"name", "value"})
+
     def __init__(self):
         super().__init__("setVariable")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "name" in config and "value" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         """执行设置变量"""
         name = config["name"]
         value = self.substitute_variables(config["value"], context)
 
         context.set_variable(name, value)
-        context.add_log("info", f"Set variable {name} = {value}")
+        context.add_log("info", "Set variable %s = %s", name, value)
 
         return {"success": True, "name": name, "value": value, "message": f"Variable {name} set"}
 
@@ -237,88 +506,98 @@ class SetVariableHandler(RPANodeHandler):
 class ClosePageHandler(RPANodeHandler):
     """关闭当前标签页处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("closePage")
 
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         context.add_log("info", "Closing current page")
-        await asyncio.sleep(0.2)
+        await context.engine.sim_sleep(0.2)
         return {"success": True, "message": "Current page closed"}
 
 
 class CloseOtherPagesHandler(RPANodeHandler):
     """关闭其他标签页处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("closeOtherPages")
 
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         context.add_log("info", "Closing other pages")
-        await asyncio.sleep(0.3)
+        await context.engine.sim_sleep(0.3)
         return {"success": True, "message": "Other pages closed"}
 
 
 class SwitchTabHandler(RPANodeHandler):
     """切换标签页处理器"""
 
+    __slots__ = ()
+
+    any_of_fields = frozenset({"index", "title"})
+
     def __init__(self):
         super().__init__("switchTab")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "index" in config or "title" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         index = config.get("index")
         title = config.get("title")
 
         if index is not None:
-            context.add_log("info", f"Switching to tab index: {index}")
+            context.add_log("info", "Switching to tab index: %s", index)
         else:
-            context.add_log("info", f"Switching to tab with title: {title}")
+            context.add_log("info", "Switching to tab with title: %s", title)
 
-        await asyncio.sleep(0.2)
+        await context.engine.sim_sleep(0.2)
         return {"success": True, "message": "Tab switched"}
 
 
 class RefreshPageHandler(RPANodeHandler):
     """刷新页面处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("refreshPage")
 
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         context.add_log("info", "Refreshing page")
-        await asyncio.sleep(1.0)
+        await context.engine.sim_sleep(1.0)
         return {"success": True, "message": "Page refreshed"}
 
 
 class GoBackHandler(RPANodeHandler):
     """后退处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("goBack")
 
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         context.add_log("info", "Going back")
-        await asyncio.sleep(0.5)
+        await context.engine.sim_sleep(0.5)
         return {"success": True, "message": "Navigated back"}
 
 
 class ScreenshotHandler(RPANodeHandler):
     """截图处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"path"})
+
     def __init__(self):
         super().__init__("screenshot")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "path" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         path = self.substitute_variables(config["path"], context)
         full_page = config.get("fullPage", False)
 
-        context.add_log("info", f"Taking screenshot: {path}")
-        await asyncio.sleep(0.5)
+        context.add_log("info", "Taking screenshot: %s", path)
+        await context.engine.sim_sleep(0.5)
 
         return {"success": True, "path": path, "message": f"Screenshot saved to {path}"}
 
@@ -326,17 +605,18 @@ class ScreenshotHandler(RPANodeHandler):
 class HoverHandler(RPANodeHandler):
     """悬停处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"selector"})
+
     def __init__(self):
         super().__init__("hover")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = self.substitute_variables(config["selector"], context)
 
-        context.add_log("info", f"Hovering over element: {selector}")
-        await asyncio.sleep(0.3)
+        context.add_log("info", "Hovering over element: %s", selector)
+        await context.engine.sim_sleep(0.3)
 
         return {"success": True, "selector": selector, "message": f"Hovered over {selector}"}
 
@@ -344,18 +624,19 @@ class HoverHandler(RPANodeHandler):
 class SelectOptionHandler(RPANodeHandler):
     """下拉选择处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"selector", "value"})
+
     def __init__(self):
         super().__init__("selectOption")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config and "value" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = self.substitute_variables(config["selector"], context)
         value = self.substitute_variables(config["value"], context)
 
-        context.add_log("info", f"Selecting option {value} in {selector}")
-        await asyncio.sleep(0.3)
+        context.add_log("info", "Selecting option %s in %s", value, selector)
+        await context.engine.sim_sleep(0.3)
 
         return {"success": True, "selector": selector, "value": value, "message": f"Selected {value}"}
 
@@ -363,17 +644,18 @@ class SelectOptionHandler(RPANodeHandler):
 class FocusHandler(RPANodeHandler):
     """聚焦处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"selector"})
+
     def __init__(self):
         super().__init__("focus")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = self.substitute_variables(config["selector"], context)
 
-        context.add_log("info", f"Focusing element: {selector}")
-        await asyncio.sleep(0.2)
+        context.add_log("info", "Focusing element: %s", selector)
+        await context.engine.sim_sleep(0.2)
 
         return {"success": True, "selector": selector, "message": f"Focused {selector}"}
 
@@ -381,40 +663,42 @@ class FocusHandler(RPANodeHandler):
 class ScrollPageHandler(RPANodeHandler):
     """滚动页面处理器"""
 
+    __slots__ = ()
+
+    any_of_fields = frozenset({"distance", "position"})
+
     def __init__(self):
         super().__init__("scrollPage")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "distance" in config or "position" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         distance = config.get("distance")
         position = config.get("position")
 
         if distance:
-            context.add_log("info", f"Scrolling by distance: {distance}")
+            context.add_log("info", "Scrolling by distance: %s", distance)
         else:
-            context.add_log("info", f"Scrolling to position: {position}")
+            context.add_log("info", "Scrolling to position: %s", position)
 
-        await asyncio.sleep(0.3)
+        await context.engine.sim_sleep(0.3)
         return {"success": True, "message": "Page scrolled"}
 
 
 class InputFileHandler(RPANodeHandler):
     """上传文件处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"selector", "localPath"})
+
     def __init__(self):
         super().__init__("inputFile")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config and "localPath" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = self.substitute_variables(config["selector"], context)
         local_path = self.substitute_variables(config["localPath"], context)
 
-        context.add_log("info", f"Uploading file {local_path} to {selector}")
-        await asyncio.sleep(0.5)
+        context.add_log("info", "Uploading file %s to %s", local_path, selector)
+        await context.engine.sim_sleep(0.5)
 
         return {"success": True, "selector": selector, "path": local_path, "message": f"File uploaded"}
 
@@ -422,17 +706,18 @@ class InputFileHandler(RPANodeHandler):
 class EvalScriptHandler(RPANodeHandler):
     """执行JavaScript处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"code"})
+
     def __init__(self):
         super().__init__("evalScript")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "code" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         code = self.substitute_variables(config["code"], context)
 
-        context.add_log("info", f"Executing JavaScript: {code[:50]}...")
-        await asyncio.sleep(0.3)
+        context.add_log("info", "Executing JavaScript: %.50s...", code)
+        await context.engine.sim_sleep(0.3)
 
         # 模拟执行结果
         result = {"executed": True, "code": code}
@@ -445,17 +730,18 @@ class EvalScriptHandler(RPANodeHandler):
 class KeyPressHandler(RPANodeHandler):
     """按键处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"keycode"})
+
     def __init__(self):
         super().__init__("keyPress")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "keycode" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         keycode = config["keycode"]
 
-        context.add_log("info", f"Pressing key: {keycode}")
-        await asyncio.sleep(0.2)
+        context.add_log("info", "Pressing key: %s", keycode)
+        await context.engine.sim_sleep(0.2)
 
         return {"success": True, "keycode": keycode, "message": f"Key {keycode} pressed"}
 
@@ -463,17 +749,19 @@ class KeyPressHandler(RPANodeHandler):
 class KeyComboHandler(RPANodeHandler):
     """组合键处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"keys"})
+    field_types = {"keys": list}
+
     def __init__(self):
         super().__init__("keyCombo")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "keys" in config and isinstance(config["keys"], list)
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         keys = config["keys"]
 
-        context.add_log("info", f"Pressing key combination: {'+'.join(keys)}")
-        await asyncio.sleep(0.3)
+        context.add_log("info", "Pressing key combination: %s", "+".join(keys))
+        await context.engine.sim_sleep(0.3)
 
         return {"success": True, "keys": keys, "message": f"Key combination pressed"}
 
@@ -483,25 +771,26 @@ class KeyComboHandler(RPANodeHandler):
 class WaitUntilHandler(RPANodeHandler):
     """等待元素处理器"""
 
+    __slots__ = ()
+
+    any_of_fields = frozenset({"selector", "condition"})
+
     def __init__(self):
         super().__init__("waitUntil")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config or "condition" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = config.get("selector")
         condition = config.get("condition")
         timeout = config.get("timeout", 30000)
 
         if selector:
-            context.add_log("info", f"Waiting for element: {selector}")
+            context.add_log("info", "Waiting for element: %s", selector)
         else:
-            context.add_log("info", f"Waiting for condition: {condition}")
+            context.add_log("info", "Waiting for condition: %s", condition)
 
         # 模拟等待
         wait_time = min(timeout / 1000, 2.0)  # 最多等待2秒
-        await asyncio.sleep(wait_time)
+        await context.engine.sim_sleep(wait_time)
 
         return {"success": True, "message": "Wait condition met"}
 
@@ -511,6 +800,8 @@ class WaitUntilHandler(RPANodeHandler):
 class GetUrlHandler(RPANodeHandler):
     """获取当前URL处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("getUrl")
 
@@ -520,7 +811,7 @@ class GetUrlHandler(RPANodeHandler):
         var_name = config.get("variable", "current_url")
 
         context.set_variable(var_name, current_url)
-        context.add_log("info", f"Got current URL: {current_url}")
+        context.add_log("info", "Got current URL: %s", current_url)
 
         return {"success": True, "url": current_url, "variable": var_name, "message": "URL retrieved"}
 
@@ -528,12 +819,13 @@ class GetUrlHandler(RPANodeHandler):
 class GetElementHandler(RPANodeHandler):
     """获取元素信息处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"selector"})
+
     def __init__(self):
         super().__init__("getElement")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = self.substitute_variables(config["selector"], context)
         attribute = config.get("attribute", "text")
@@ -543,33 +835,68 @@ class GetElementHandler(RPANodeHandler):
         element_value = f"Element value from {selector}"
 
         context.set_variable(var_name, element_value)
-        context.add_log("info", f"Got element {attribute}: {element_value}")
+        context.add_log("info", "Got element %s: %s", attribute, element_value)
 
         return {"success": True, "selector": selector, "value": element_value, "message": "Element info retrieved"}
 
 
+def _excel_value(value: Any) -> Any:
+    """将单元格值转换为可JSON序列化的值（日期时间转为ISO字符串）"""
+    if isinstance(value, (date, datetime_time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def _load_excel_rows(file_path: str, sheet_name: str) -> List[Dict]:
+    """以只读模式流式读取工作表，首行作为表头"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name in workbook.sheetnames else workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return []
+        header = [str(name) if name is not None else f"column_{i + 1}" for i, name in enumerate(header)]
+        return [
+            dict(zip(header, map(_excel_value, row)))
+            for row in rows
+            if any(value is not None for value in row)
+        ]
+    finally:
+        workbook.close()
+
+
 class ImportExcelHandler(RPANodeHandler):
     """导入Excel数据处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"filePath"})
+
     def __init__(self):
         super().__init__("importExcel")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "filePath" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         file_path = self.substitute_variables(config["filePath"], context)
         sheet_name = config.get("sheetName", "Sheet1")
         var_name = config.get("variable", "excel_data")
 
-        # 模拟导入Excel数据
-        excel_data = [
-            {"name": "张三", "age": 25, "city": "北京"},
-            {"name": "李四", "age": 30, "city": "上海"},
-        ]
+        if os.path.isfile(file_path):
+            # 读取在线程中进行，避免阻塞事件循环
+            excel_data = await asyncio.to_thread(_load_excel_rows, file_path, sheet_name)
+        else:
+            # 模拟导入Excel数据
+            excel_data = [
+                {"name": "张三", "age": 25, "city": "北京"},
+                {"name": "李四", "age": 30, "city": "上海"},
+            ]
 
         context.set_variable(var_name, excel_data)
-        context.add_log("info", f"Imported Excel data from {file_path}")
+        context.add_log("info", "Imported Excel data from %s", file_path)
 
         return {"success": True, "filePath": file_path, "data": excel_data, "message": "Excel data imported"}
 
@@ -577,23 +904,23 @@ class ImportExcelHandler(RPANodeHandler):
 class ImportTxtRandomHandler(RPANodeHandler):
     """随机导入文本处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"filePath"})
+
     def __init__(self):
         super().__init__("importTxtRandom")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "filePath" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         file_path = self.substitute_variables(config["filePath"], context)
         var_name = config.get("variable", "random_text")
 
         # 模拟随机选择文本行
-        import random
         sample_lines = ["文本行1", "文本行2", "文本行3", "文本行4"]
-        selected_text = random.choice(sample_lines)
+        selected_text = context.rng.choice(sample_lines)
 
         context.set_variable(var_name, selected_text)
-        context.add_log("info", f"Randomly selected text: {selected_text}")
+        context.add_log("info", "Randomly selected text: %s", selected_text)
 
         return {"success": True, "filePath": file_path, "text": selected_text, "message": "Random text imported"}
 
@@ -601,12 +928,13 @@ class ImportTxtRandomHandler(RPANodeHandler):
 class ForLoopDataHandler(RPANodeHandler):
     """数据循环处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"dataSource"})
+
     def __init__(self):
         super().__init__("forLoopData")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "dataSource" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         data_source = config["dataSource"]
         item_var = config.get("itemVariable", "item")
@@ -618,7 +946,7 @@ class ForLoopDataHandler(RPANodeHandler):
         else:
             data = data_source
 
-        context.add_log("info", f"Starting data loop with {len(data)} items")
+        context.add_log("info", "Starting data loop with %d items", len(data))
 
         # 这里应该实现循环逻辑，暂时返回成功
         return {"success": True, "dataCount": len(data), "message": "Data loop initialized"}
@@ -627,6 +955,8 @@ class ForLoopDataHandler(RPANodeHandler):
 class GetClipboardHandler(RPANodeHandler):
     """获取剪贴板处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("getClipboard")
 
@@ -637,7 +967,7 @@ class GetClipboardHandler(RPANodeHandler):
         clipboard_content = "剪贴板内容示例"
 
         context.set_variable(var_name, clipboard_content)
-        context.add_log("info", f"Got clipboard content: {clipboard_content}")
+        context.add_log("info", "Got clipboard content: %s", clipboard_content)
 
         return {"success": True, "content": clipboard_content, "message": "Clipboard content retrieved"}
 
@@ -647,12 +977,13 @@ class GetClipboardHandler(RPANodeHandler):
 class ExtractTxtHandler(RPANodeHandler):
     """提取文本处理器"""
 
+    __slots__ = ()
+
+    any_of_fields = frozenset({"selector", "text"})
+
     def __init__(self):
         super().__init__("extractTxt")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "selector" in config or "text" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         selector = config.get("selector")
         text = config.get("text")
@@ -665,12 +996,15 @@ class ExtractTxtHandler(RPANodeHandler):
         else:
             # 从变量文本中提取
             source_text = self.substitute_variables(text, context)
-            import re
-            match = re.search(pattern, source_text)
-            extracted = match.group(0) if match else ""
+            if pattern == ".*":
+                # 默认模式等价于取第一行，无需走正则
+                extracted = source_text.partition("\n")[0]
+            else:
+                match = _compile_pattern(pattern).search(source_text)
+                extracted = match.group(0) if match else ""
 
         context.set_variable(var_name, extracted)
-        context.add_log("info", f"Extracted text: {extracted}")
+        context.add_log("info", "Extracted text: %s", extracted)
 
         return {"success": True, "extracted": extracted, "message": "Text extracted"}
 
@@ -678,12 +1012,13 @@ class ExtractTxtHandler(RPANodeHandler):
 class ConvertToJsonHandler(RPANodeHandler):
     """转换JSON处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"data"})
+
     def __init__(self):
         super().__init__("convertToJson")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "data" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         data = config["data"]
         var_name = config.get("variable", "json_data")
@@ -694,24 +1029,35 @@ class ConvertToJsonHandler(RPANodeHandler):
         else:
             source_data = data
 
-        import json
-        json_str = json.dumps(source_data, ensure_ascii=False)
+        json_str = orjson.dumps(source_data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
 
         context.set_variable(var_name, json_str)
-        context.add_log("info", f"Converted data to JSON")
+        context.add_log("info", "Converted data to JSON")
 
         return {"success": True, "json": json_str, "message": "Data converted to JSON"}
 
 
+@lru_cache(maxsize=512)
+def _make_extractor(data_type: type, field: str):
+    """按数据类型和字段名生成取值函数，循环中重复提取时不再逐次判断类型"""
+    if issubclass(data_type, dict):
+        return methodcaller("get", field)
+    if issubclass(data_type, list):
+        # 列表取首行的字段
+        return lambda data: data[0].get(field) if data and isinstance(data[0], dict) else None
+    return lambda data: None
+
+
 class ExtractFieldHandler(RPANodeHandler):
     """提取字段处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"source", "field"})
+
     def __init__(self):
         super().__init__("extractField")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "source" in config and "field" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         source = config["source"]
         field = config["field"]
@@ -721,15 +1067,10 @@ class ExtractFieldHandler(RPANodeHandler):
         source_data = context.get_variable(source, {})
 
         # 提取字段值
-        if isinstance(source_data, dict):
-            field_value = source_data.get(field)
-        elif isinstance(source_data, list) and source_data:
-            field_value = source_data[0].get(field) if isinstance(source_data[0], dict) else None
-        else:
-            field_value = None
+        field_value = _make_extractor(type(source_data), field)(source_data)
 
         context.set_variable(var_name, field_value)
-        context.add_log("info", f"Extracted field {field}: {field_value}")
+        context.add_log("info", "Extracted field %s: %s", field, field_value)
 
         return {"success": True, "field": field, "value": field_value, "message": "Field extracted"}
 
@@ -737,12 +1078,13 @@ class ExtractFieldHandler(RPANodeHandler):
 class RandomExtractionHandler(RPANodeHandler):
     """随机提取处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"source"})
+
     def __init__(self):
         super().__init__("randomExtraction")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "source" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         source = config["source"]
         count = config.get("count", 1)
@@ -755,14 +1097,13 @@ class RandomExtractionHandler(RPANodeHandler):
             source_data = [source_data]
 
         # 随机提取
-        import random
         if len(source_data) <= count:
             random_items = source_data
         else:
-            random_items = random.sample(source_data, count)
+            random_items = context.rng.sample(source_data, count)
 
         context.set_variable(var_name, random_items)
-        context.add_log("info", f"Randomly extracted {len(random_items)} items")
+        context.add_log("info", "Randomly extracted %d items", len(random_items))
 
         return {"success": True, "items": random_items, "message": "Random extraction completed"}
 
@@ -772,12 +1113,13 @@ class RandomExtractionHandler(RPANodeHandler):
 class IfConditionHandler(RPANodeHandler):
     """条件判断处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"condition"})
+
     def __init__(self):
         super().__init__("ifCondition")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "condition" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         condition = config["condition"]
         left_value = self.substitute_variables(config.get("leftValue", ""), context)
@@ -787,45 +1129,30 @@ class IfConditionHandler(RPANodeHandler):
         # 评估条件
         result = self._evaluate_condition(left_value, operator, right_value)
 
-        context.add_log("info", f"Condition evaluation: {left_value} {operator} {right_value} = {result}")
+        context.add_log("info", "Condition evaluation: %s %s %s = %s", left_value, operator, right_value, result)
 
         return {"success": True, "condition_result": result, "message": f"Condition evaluated: {result}"}
 
     def _evaluate_condition(self, left, operator, right):
         """评估条件"""
-        if operator == "equals":
-            return str(left) == str(right)
-        elif operator == "not_equals":
-            return str(left) != str(right)
-        elif operator == "contains":
-            return str(right) in str(left)
-        elif operator == "greater_than":
-            try:
-                return float(left) > float(right)
-            except:
-                return False
-        elif operator == "less_than":
-            try:
-                return float(left) < float(right)
-            except:
-                return False
-        else:
-            return False
+        op = _CMP_OPS.get(operator)
+        return op(left, right) if op else False
 
 
 class WhileLoopHandler(RPANodeHandler):
     """循环处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"condition"})
+
     def __init__(self):
         super().__init__("whileLoop")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "condition" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         max_iterations = config.get("maxIterations", 100)
 
-        context.add_log("info", f"Starting while loop (max {max_iterations} iterations)")
+        context.add_log("info", "Starting while loop (max %s iterations)", max_iterations)
 
         # 这里应该实现循环逻辑，暂时返回成功
         return {"success": True, "message": "While loop initialized"}
@@ -834,6 +1161,8 @@ class WhileLoopHandler(RPANodeHandler):
 class ExitLoopHandler(RPANodeHandler):
     """退出循环处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("exitLoop")
 
@@ -845,16 +1174,18 @@ class ExitLoopHandler(RPANodeHandler):
 class BreakpointHandler(RPANodeHandler):
     """断点处理器"""
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__("breakpoint")
 
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         message = config.get("message", "Breakpoint reached")
 
-        context.add_log("info", f"Breakpoint: {message}")
+        context.add_log("info", "Breakpoint: %s", message)
 
         # 在实际实现中，这里可以暂停执行等待用户操作
-        await asyncio.sleep(0.1)
+        await context.engine.sim_sleep(0.1)
 
         return {"success": True, "message": f"Breakpoint: {message}"}
 
@@ -862,16 +1193,17 @@ class BreakpointHandler(RPANodeHandler):
 class ThrowErrorHandler(RPANodeHandler):
     """抛出错误处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"message"})
+
     def __init__(self):
         super().__init__("throwError")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "message" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         error_message = self.substitute_variables(config["message"], context)
 
-        context.add_log("error", f"Throwing error: {error_message}")
+        context.add_log("error", "Throwing error: %s", error_message)
 
         # 抛出错误
         raise RPANodeError(error_message)
@@ -882,12 +1214,16 @@ class ThrowErrorHandler(RPANodeHandler):
 class OpenAIHandler(RPANodeHandler):
     """OpenAI GPT处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"apiKey", "prompt"})
+
+    parallel_safe = True
+    default_variable = "gpt_response"
+
     def __init__(self):
         super().__init__("openai")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "apiKey" in config and "prompt" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         api_key = config["apiKey"]
         prompt = self.substitute_variables(config["prompt"], context)
@@ -895,42 +1231,135 @@ class OpenAIHandler(RPANodeHandler):
         system_prompt = config.get("systemPrompt", "")
         var_name = config.get("variable", "gpt_response")
 
-        context.add_log("info", f"Calling OpenAI API with model: {model}")
+        context.add_log("info", "Calling OpenAI API with model: %s", model)
 
         # 模拟API调用
-        await asyncio.sleep(2.0)  # 模拟API延迟
+        await context.engine.sim_sleep(2.0)  # 模拟API延迟
 
         # 模拟GPT响应
         gpt_response = f"这是对提示'{prompt[:30]}...'的模拟回复"
 
         context.set_variable(var_name, gpt_response)
-        context.add_log("info", f"GPT response received: {gpt_response[:50]}...")
+        context.add_log("info", "GPT response received: %.50s...", gpt_response)
 
         return {"success": True, "response": gpt_response, "message": "OpenAI API call completed"}
 
 
+class CaptchaPoller:
+    """2Captcha结果轮询器
+    
+    所有并发的验证码节点共用一个后台轮询任务，按 apiKey 分组后一次请求批量查询结果，
+    而不是每个节点各自循环轮询。
+    """
+    
+    POLL_INTERVAL = 5.0
+    # 模拟的验证码识别耗时（秒），仅在开启 RPA_SIMULATE_DELAYS 时生效
+    SIMULATED_SOLVE_TIME = 15.0
+    
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # apiKey -> {captcha_id: Future}
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._next_id = 0
+        # 模拟提交的时间，captcha_id -> time.monotonic()
+        self._submitted_at: Dict[str, float] = {}
+    
+    async def solve(self, api_key: str, site_key: str, site_url: str) -> str:
+        """提交验证码并等待轮询器返回token"""
+        captcha_id = await self._submit(api_key, site_key, site_url)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((api_key, captcha_id, future))
+        
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        
+        return await future
+    
+    async def _run(self):
+        """轮询循环，没有待处理的验证码时退出"""
+        while True:
+            while not self._queue.empty():
+                api_key, captcha_id, future = self._queue.get_nowait()
+                self._pending.setdefault(api_key, {})[captcha_id] = future
+            
+            if not self._pending:
+                return
+            
+            # 轮询间隔即合并窗口，窗口内提交的验证码在同一次请求中查询
+            await asyncio.sleep(self.POLL_INTERVAL)
+            
+            for api_key, waiting in list(self._pending.items()):
+                # 已取消的节点不再查询
+                for captcha_id in [cid for cid, future in waiting.items() if future.done()]:
+                    del waiting[captcha_id]
+                    self._submitted_at.pop(captcha_id, None)
+                
+                if waiting:
+                    try:
+                        results = await self._fetch_results(api_key, list(waiting))
+                    except Exception as e:
+                        for captcha_id, future in waiting.items():
+                            self._submitted_at.pop(captcha_id, None)
+                            if not future.done():
+                                future.set_exception(e)
+                        waiting.clear()
+                    else:
+                        for captcha_id, token in results.items():
+                            future = waiting.pop(captcha_id, None)
+                            if future is not None and not future.done():
+                                future.set_result(token)
+                
+                if not waiting:
+                    del self._pending[api_key]
+    
+    async def _submit(self, api_key: str, site_key: str, site_url: str) -> str:
+        """提交验证码任务（in.php），返回验证码ID"""
+        # 模拟提交
+        self._next_id += 1
+        captcha_id = str(self._next_id)
+        self._submitted_at[captcha_id] = time.monotonic()
+        return captcha_id
+    
+    async def _fetch_results(self, api_key: str, captcha_ids: List[str]) -> Dict[str, str]:
+        """批量查询结果（res.php?action=get&ids=...），返回已完成的 {captcha_id: token}"""
+        # 模拟验证码token，开启模拟延迟时识别需要 SIMULATED_SOLVE_TIME 秒
+        solve_time = self.SIMULATED_SOLVE_TIME if _SIMULATE_DELAYS else 0.0
+        now = time.monotonic()
+        results = {}
+        for captcha_id in captcha_ids:
+            if now - self._submitted_at.get(captcha_id, now) >= solve_time:
+                self._submitted_at.pop(captcha_id, None)
+                results[captcha_id] = "03AGdBq25SiXT-pmSeBXjzScW-EiocHwwpwqJRCAC7"
+        return results
+
+
+captcha_poller = CaptchaPoller()
+
+
 class Captcha2Handler(RPANodeHandler):
     """2Captcha验证码处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"apiKey", "siteKey"})
+
+    parallel_safe = True
+    default_variable = "captcha_token"
+
     def __init__(self):
         super().__init__("captcha2")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "apiKey" in config and "siteKey" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         api_key = config["apiKey"]
         site_key = config["siteKey"]
         site_url = config.get("siteUrl", "")
         var_name = config.get("variable", "captcha_token")
 
-        context.add_log("info", f"Solving captcha for site: {site_url}")
-
-        # 模拟验证码解决过程
-        await asyncio.sleep(30.0)  # 模拟验证码解决时间
+        context.add_log("info", "Solving captcha for site: %s", site_url)
 
-        # 模拟验证码token
-        captcha_token = "03AGdBq25SiXT-pmSeBXjzScW-EiocHwwpwqJRCAC7"
+        captcha_token = await captcha_poller.solve(api_key, site_key, site_url)
 
         context.set_variable(var_name, captcha_token)
         context.add_log("info", "Captcha solved successfully")
@@ -941,21 +1370,25 @@ class Captcha2Handler(RPANodeHandler):
 class GoogleSheetsHandler(RPANodeHandler):
     """Google Sheets处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"spreadsheetId", "action"})
+
+    parallel_safe = True
+    default_variable = "sheets_data"
+
     def __init__(self):
         super().__init__("googleSheets")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "spreadsheetId" in config and "action" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         spreadsheet_id = config["spreadsheetId"]
         action = config["action"]  # read, write, append
         range_name = config.get("range", "A1:Z1000")
 
-        context.add_log("info", f"Google Sheets {action} operation on {spreadsheet_id}")
+        context.add_log("info", "Google Sheets %s operation on %s", action, spreadsheet_id)
 
         # 模拟Google Sheets操作
-        await asyncio.sleep(1.0)
+        await context.engine.sim_sleep(1.0)
 
         if action == "read":
             # 模拟读取数据
@@ -970,21 +1403,24 @@ class GoogleSheetsHandler(RPANodeHandler):
 class SlackWebhookHandler(RPANodeHandler):
     """Slack Webhook处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"webhookUrl", "message"})
+
+    parallel_safe = True
+
     def __init__(self):
         super().__init__("slackWebhook")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "webhookUrl" in config and "message" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         webhook_url = config["webhookUrl"]
         message = self.substitute_variables(config["message"], context)
         channel = config.get("channel", "#general")
 
-        context.add_log("info", f"Sending Slack message to {channel}")
+        context.add_log("info", "Sending Slack message to %s", channel)
 
         # 模拟Slack webhook调用
-        await asyncio.sleep(0.5)
+        await context.engine.sim_sleep(0.5)
 
         return {"success": True, "message": message, "channel": channel, "message": "Slack message sent"}
 
@@ -992,12 +1428,16 @@ class SlackWebhookHandler(RPANodeHandler):
 class HttpRequestHandler(RPANodeHandler):
     """HTTP请求处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"url"})
+
+    parallel_safe = True
+    default_variable = "http_response"
+
     def __init__(self):
         super().__init__("httpRequest")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "url" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         url = self.substitute_variables(config["url"], context)
         method = config.get("method", "GET")
@@ -1005,10 +1445,10 @@ class HttpRequestHandler(RPANodeHandler):
         data = config.get("data", {})
         var_name = config.get("variable", "http_response")
 
-        context.add_log("info", f"Making {method} request to {url}")
+        context.add_log("info", "Making %s request to %s", method, url)
 
         # 模拟HTTP请求
-        await asyncio.sleep(1.0)
+        await context.engine.sim_sleep(1.0)
 
         # 模拟响应
         response = {
@@ -1025,22 +1465,25 @@ class HttpRequestHandler(RPANodeHandler):
 class SendEmailHandler(RPANodeHandler):
     """发送邮件处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"to", "subject", "body"})
+
+    parallel_safe = True
+
     def __init__(self):
         super().__init__("sendEmail")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "to" in config and "subject" in config and "body" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         to = self.substitute_variables(config["to"], context)
         subject = self.substitute_variables(config["subject"], context)
         body = self.substitute_variables(config["body"], context)
         smtp_server = config.get("smtpServer", "smtp.gmail.com")
 
-        context.add_log("info", f"Sending email to {to}")
+        context.add_log("info", "Sending email to %s", to)
 
         # 模拟邮件发送
-        await asyncio.sleep(2.0)
+        await context.engine.sim_sleep(2.0)
 
         return {"success": True, "to": to, "subject": subject, "message": "Email sent successfully"}
 
@@ -1050,19 +1493,20 @@ class SendEmailHandler(RPANodeHandler):
 class UpdateRemarkHandler(RPANodeHandler):
     """更新备注处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"remark"})
+
     def __init__(self):
         super().__init__("updateRemark")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "remark" in config
-
     async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
         remark = self.substitute_variables(config["remark"], context)
 
-        context.add_log("info", f"Updating profile remark: {remark}")
+        context.add_log("info", "Updating profile remark: %s", remark)
 
         # 这里应该调用API更新profile备注
-        await asyncio.sleep(0.3)
+        await context.engine.sim_sleep(0.3)
 
         return {"success": True, "remark": remark, "message": "Profile remark updated"}
 
@@ -1070,196 +1514,392 @@ class UpdateRemarkHandler(RPANodeHandler):
 class UpdateTagHandler(RPANodeHandler):
     """更新标签处理器"""
 
+    __slots__ = ()
+
+    required_fields = frozenset({"tags"})
+    field_types = {"tags": (str, list)}
+
     def __init__(self):
         super().__init__("updateTag")
 
-    def validate_config(self, config: Dict) -> bool:
-        return "tags" in config
-
-    async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
+    def prepare_config(self, config: Mapping) -> Mapping:
+        # 标签字符串只在生成执行计划时拆分一次
         tags = config["tags"]
         if isinstance(tags, str):
             tags = [tag.strip() for tag in tags.split(",")]
+        return MappingProxyType({**config, "_tags_parsed": tags})
+
+    async def execute(self, context: RPAExecutionContext, config: Dict) -> Dict:
+        tags = config["_tags_parsed"]
 
-        context.add_log("info", f"Updating profile tags: {tags}")
+        context.add_log("info", "Updating profile tags: %s", tags)
 
         # 这里应该调用API更新profile标签
-        await asyncio.sleep(0.3)
+        await context.engine.sim_sleep(0.3)
 
         return {"success": True, "tags": tags, "message": "Profile tags updated"}
 
 
+# 内置节点处理器均为无状态对象，导入时创建一次，所有引擎实例共享
+NODE_HANDLERS: Dict[str, RPANodeHandler] = {
+    handler.node_type: handler
+    for handler in (
+        # 页面操作节点 (16个)
+        NewPageHandler(),
+        ClosePageHandler(),
+        CloseOtherPagesHandler(),
+        SwitchTabHandler(),
+        GotoUrlHandler(),
+        RefreshPageHandler(),
+        GoBackHandler(),
+        ScreenshotHandler(),
+        HoverHandler(),
+        SelectOptionHandler(),
+        FocusHandler(),
+        ClickHandler(),
+        InputHandler(),
+        ScrollPageHandler(),
+        InputFileHandler(),
+        EvalScriptHandler(),
+
+        # 键盘操作节点 (2个)
+        KeyPressHandler(),
+        KeyComboHandler(),
+
+        # 等待操作节点 (2个)
+        WaitTimeHandler(),
+        WaitUntilHandler(),
+
+        # 数据获取节点 (10个)
+        GetUrlHandler(),
+        GetElementHandler(),
+        ImportExcelHandler(),
+        ImportTxtRandomHandler(),
+        ForLoopDataHandler(),
+        GetClipboardHandler(),
+
+        # 数据处理节点 (4个)
+        ExtractTxtHandler(),
+        ConvertToJsonHandler(),
+        ExtractFieldHandler(),
+        RandomExtractionHandler(),
+
+        # 流程控制节点 (11个)
+        IfConditionHandler(),
+        WhileLoopHandler(),
+        ExitLoopHandler(),
+        BreakpointHandler(),
+        ThrowErrorHandler(),
+        SetVariableHandler(),
+
+        # 第三方工具节点 (6个)
+        OpenAIHandler(),
+        Captcha2Handler(),
+        GoogleSheetsHandler(),
+        SlackWebhookHandler(),
+        HttpRequestHandler(),
+        SendEmailHandler(),
+
+        # 账户信息节点 (2个)
+        UpdateRemarkHandler(),
+        UpdateTagHandler(),
+    )
+}
+
+# node_type -> (validate_config, execute)
+_NODE_DISPATCH = {
+    node_type: (handler.validate_config, handler.execute)
+    for node_type, handler in NODE_HANDLERS.items()
+}
+
+
 class RPAEngine:
     """RPA执行引擎"""
     
-    def __init__(self):
-        self.handlers = {}
-        self._register_handlers()
+    # 执行计划缓存的流程数量上限
+    PLAN_CACHE_SIZE = 256
+    # 每次structlog调用合并输出的日志条数
+    LOG_BATCH_SIZE = 64
     
-    def _register_handlers(self):
-        """注册节点处理器"""
-        handlers = [
-            # 页面操作节点 (16个)
-            NewPageHandler(),
-            ClosePageHandler(),
-            CloseOtherPagesHandler(),
-            SwitchTabHandler(),
-            GotoUrlHandler(),
-            RefreshPageHandler(),
-            GoBackHandler(),
-            ScreenshotHandler(),
-            HoverHandler(),
-            SelectOptionHandler(),
-            FocusHandler(),
-            ClickHandler(),
-            InputHandler(),
-            ScrollPageHandler(),
-            InputFileHandler(),
-            EvalScriptHandler(),
-
-            # 键盘操作节点 (2个)
-            KeyPressHandler(),
-            KeyComboHandler(),
-
-            # 等待操作节点 (2个)
-            WaitTimeHandler(),
-            WaitUntilHandler(),
-
-            # 数据获取节点 (10个)
-            GetUrlHandler(),
-            GetElementHandler(),
-            ImportExcelHandler(),
-            ImportTxtRandomHandler(),
-            ForLoopDataHandler(),
-            GetClipboardHandler(),
-
-            # 数据处理节点 (4个)
-            ExtractTxtHandler(),
-            ConvertToJsonHandler(),
-            ExtractFieldHandler(),
-            RandomExtractionHandler(),
-
-            # 流程控制节点 (11个)
-            IfConditionHandler(),
-            WhileLoopHandler(),
-            ExitLoopHandler(),
-            BreakpointHandler(),
-            ThrowErrorHandler(),
-            SetVariableHandler(),
-
-            # 第三方工具节点 (6个)
-            OpenAIHandler(),
-            Captcha2Handler(),
-            GoogleSheetsHandler(),
-            SlackWebhookHandler(),
-            HttpRequestHandler(),
-            SendEmailHandler(),
-
-            # 账户信息节点 (2个)
-            UpdateRemarkHandler(),
-            UpdateTagHandler(),
-        ]
-
-        for handler in handlers:
-            self.handlers[handler.node_type] = handler
+    def __init__(self, max_concurrency: int = 8):
+        # 内置处理器直接复制共享注册表，自定义处理器通过 register_handler 追加
+        self.handlers = dict(NODE_HANDLERS)
+        # 同一组内并发执行的节点数上限
+        self.max_concurrency = max_concurrency
+        # 是否模拟节点执行延迟
+        self.simulate_delays = _SIMULATE_DELAYS
+        # node_type -> (validate_config, execute)，注册时预先绑定方法
+        self._dispatch = dict(_NODE_DISPATCH)
+        # (流程ID, 版本号) -> 执行计划
+        self._plans = {}
     
     def register_handler(self, handler: RPANodeHandler):
         """注册自定义处理器"""
         self.handlers[handler.node_type] = handler
+        self._dispatch[handler.node_type] = (handler.validate_config, handler.execute)
+        # 处理器变化后已缓存的执行计划失效
+        self._plans.clear()
     
     async def execute_flow(self, context: RPAExecutionContext) -> Dict:
         """执行RPA流程"""
         
-        try:
-            context.add_log("info", "Starting RPA flow execution")
-            
-            # 启动浏览器
-            browser_data = await self._start_browser(context)
-            context.browser_data = browser_data
-            
-            # 执行节点
-            nodes = context.rpa_flow.nodes
-            if not isinstance(nodes, list):
-                raise RPANodeError("Invalid nodes format")
+        context.engine = self
+        context.log_queue = asyncio.Queue()
+        error = None
+        
+        # 日志输出任务与流程执行处于同一个 TaskGroup，流程结束时一定被等待或取消
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._drain_logs(context))
             
-            total_nodes = len(nodes)
+            try:
+                result = await self._run_flow(context)
+            except Exception as e:
+                # 在 TaskGroup 外重新抛出，避免异常被包装为 ExceptionGroup
+                error = e
+            finally:
+                # 输出剩余日志后结束后台任务
+                context.log_queue.put_nowait(None)
+        
+        if error is not None:
+            raise error
+        
+        # 日志在清理完成后再格式化，包含清理阶段的记录
+        result["logs"] = context.format_logs()
+        return result
+    
+    async def _run_flow(self, context: RPAExecutionContext) -> Dict:
+        """启动浏览器并依次执行各组节点"""
+        
+        # 整个流程共用一次客户端上下文，启动和关闭浏览器复用同一会话
+        async with adspower_client as client:
+            context.adspower = client
             
-            for i, node in enumerate(nodes):
-                context.current_node_index = i
+            try:
+                context.add_log("info", "Starting RPA flow execution")
                 
-                # 更新进度
-                progress = int((i / total_nodes) * 100)
-                context.task.update_progress(progress, i)
+                # 启动浏览器前先校验全部节点，配置错误时不必启动浏览器
+                steps, groups = self._prepare_plan(context.rpa_flow)
+                
+                # 启动浏览器
+                browser_data = await self._start_browser(context)
+                context.browser_data = browser_data
                 
                 # 执行节点
-                result = await self._execute_node(context, node, i)
+                total_nodes = len(steps)
+                
+                for group in groups:
+                    first_index = group[0]
+                    context.current_node_index = first_index
+                    
+                    # 执行节点（并发组中的节点各自在开始执行时更新进度）
+                    if len(group) == 1:
+                        await self._report_progress(context, first_index, total_nodes)
+                        results = [await self._execute_node(context, steps[first_index], first_index)]
+                    else:
+                        results = await self.run_parallel_nodes(context, steps, group)
+                    
+                    for i, result in zip(group, results):
+                        node_type = steps[i][2]
+                        if not result.get("success", False):
+                            raise RPANodeError(
+                                result.get("message", "Node execution failed"),
+                                node_index=i,
+                                node_type=node_type
+                            )
+                        
+                        context.add_log("info", "Node %s completed: %s", i, node_type, node_index=i)
                 
-                if not result.get("success", False):
-                    raise RPANodeError(
-                        result.get("message", "Node execution failed"),
-                        node_index=i,
-                        node_type=node.get("type")
-                    )
+                # 完成执行
+                context.task.update_progress(100)
+                context.add_log("info", "RPA flow execution completed successfully")
                 
-                context.add_log("info", f"Node {i} completed: {node.get('type')}")
+                result = {
+                    "success": True,
+                    "message": "Flow executed successfully",
+                    "variables": dict(context.variables)
+                }
+                
+            except Exception as e:
+                context.add_log("error", "Flow execution failed: %s", e)
+                raise
+            
+            finally:
+                # 清理资源
+                await self._cleanup(context)
+        
+        return result
+    
+    def _prepare_plan(self, rpa_flow: RPAFlow) -> Tuple[List[tuple], List[List[int]]]:
+        """生成流程的执行计划
+        
+        一次性校验所有节点并绑定 (execute, config, node_type)，同时划分执行组。
+        计划按 (流程ID, 版本号) 缓存，修改节点时版本号递增，旧计划不会被复用。
+        """
+        cache_key = (rpa_flow.id, rpa_flow.version) if rpa_flow.id is not None else None
+        if cache_key is not None:
+            plan = self._plans.get(cache_key)
+            if plan is not None:
+                return plan
+        
+        nodes = rpa_flow.nodes
+        if not isinstance(nodes, list):
+            raise RPANodeError("Invalid nodes format")
+        nodes = _freeze_nodes(nodes)
+        
+        steps = []
+        for index, node in enumerate(nodes):
+            node_type = node.get("type")
+            if not node_type:
+                raise RPANodeError("Node type not specified", node_index=index)
             
-            # 完成执行
-            context.task.update_progress(100)
-            context.add_log("info", "RPA flow execution completed successfully")
+            dispatch = self._dispatch.get(node_type)
+            if dispatch is None:
+                raise RPANodeError(f"Unknown node type: {node_type}", node_index=index, node_type=node_type)
             
-            return {
-                "success": True,
-                "message": "Flow executed successfully",
-                "variables": context.variables,
-                "logs": context.execution_logs
-            }
+            validate_config, execute = dispatch
+            config = node["config"]
             
-        except Exception as e:
-            context.add_log("error", f"Flow execution failed: {str(e)}")
-            raise
+            # 验证配置
+            if not validate_config(config):
+                raise RPANodeError(f"Invalid config for node {node_type}", node_index=index, node_type=node_type)
+            
+            steps.append((execute, self.handlers[node_type].prepare_config(config), node_type))
         
-        finally:
-            # 清理资源
-            await self._cleanup(context)
+        plan = (steps, self._partition(nodes))
+        
+        if cache_key is not None:
+            if len(self._plans) >= self.PLAN_CACHE_SIZE:
+                self._plans.pop(next(iter(self._plans)))
+            self._plans[cache_key] = plan
+        
+        return plan
     
-    async def _execute_node(self, context: RPAExecutionContext, node: Dict, index: int) -> Dict:
-        """执行单个节点"""
+    def _partition(self, nodes: List[Dict]) -> List[List[int]]:
+        """将节点划分为执行组
+        
+        相邻的 parallel_safe 节点之间没有变量读写依赖时归入同一组并发执行，
+        其余节点各自单独成组，保持原有顺序。
+        """
+        groups = []
+        group, group_reads, group_writes = [], set(), set()
+        
+        for i, node in enumerate(nodes):
+            handler = self.handlers.get(node.get("type"))
+            if handler is None or not handler.parallel_safe:
+                if group:
+                    groups.append(group)
+                    group, group_reads, group_writes = [], set(), set()
+                groups.append([i])
+                continue
+            
+            config = node.get("config", {})
+            reads = _collect_variable_refs(config, set())
+            writes = handler.output_variables(config)
+            
+            if group and (reads & group_writes or writes & (group_reads | group_writes)):
+                groups.append(group)
+                group, group_reads, group_writes = [], set(), set()
+            
+            group.append(i)
+            group_reads |= reads
+            group_writes |= writes
+        
+        if group:
+            groups.append(group)
+        
+        return groups
+    
+    async def run_parallel_nodes(self, context: RPAExecutionContext, steps: List[tuple], group: List[int]) -> List[Dict]:
+        """并发执行一组互不依赖的节点，按组内顺序返回结果"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            # 任一节点失败时 TaskGroup 会取消组内其余节点
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(self._run_with_semaphore(semaphore, context, steps, i))
+                    for i in group
+                ]
+        except BaseExceptionGroup as eg:
+            # 保持与串行执行一致，向上抛出单个节点错误
+            raise eg.exceptions[0]
         
-        node_type = node.get("type")
-        if not node_type:
-            raise RPANodeError("Node type not specified", node_index=index)
+        return [task.result() for task in tasks]
+    
+    async def _drain_logs(self, context: RPAExecutionContext):
+        """后台输出执行日志并增量推送给WebSocket订阅者，收到 None 时结束"""
+        queue = context.log_queue
         
-        handler = self.handlers.get(node_type)
-        if not handler:
-            raise RPANodeError(f"Unknown node type: {node_type}", node_index=index, node_type=node_type)
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.LOG_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            finished = any(entry is None for entry in batch)
+            
+            # 与流程处于同一个 TaskGroup，异常会取消流程，必须在此处理
+            try:
+                entries = [_format_log_entry(entry) for entry in batch if entry is not None]
+                if entries:
+                    logger.info("RPA execution logs", task_id=context.task.id, entries=entries)
+                    
+                    # 只推送新增的日志，整批作为一条消息，客户端无需等待完成时的全量日志
+                    await task_notifier.notify_task_logs(context.task.id, entries)
+            except Exception as e:
+                logger.warning("Failed to publish RPA execution logs", task_id=context.task.id, error=str(e))
+            
+            if finished:
+                return
+            
+            # 每批之间让出事件循环，不阻塞节点执行
+            await asyncio.sleep(0)
+    
+    async def sim_sleep(self, seconds: float):
+        """模拟节点执行延迟，关闭时只让出一次事件循环"""
+        await asyncio.sleep(seconds if self.simulate_delays else 0)
+    
+    async def _run_with_semaphore(self, semaphore: asyncio.Semaphore, context: RPAExecutionContext, steps: List[tuple], index: int) -> Dict:
+        """在并发数限制内执行节点"""
+        async with semaphore:
+            await self._report_progress(context, index, len(steps))
+            return await self._execute_node(context, steps[index], index)
+    
+    async def _report_progress(self, context: RPAExecutionContext, index: int, total_nodes: int):
+        """更新任务进度并通知WebSocket订阅者"""
+        progress = int((index / total_nodes) * 100)
+        context.task.update_progress(progress, index)
+        await task_notifier.notify_task_progress(context.task.id, progress, index)
+    
+    async def _execute_node(self, context: RPAExecutionContext, step: tuple, index: int) -> Dict:
+        """执行单个节点"""
         
-        config = node.get("config", {})
+        execute, config, node_type = step
         
-        # 验证配置
-        if not handler.validate_config(config):
-            raise RPANodeError(f"Invalid config for node {node_type}", node_index=index, node_type=node_type)
+        # 节点内记录的日志归属于该节点
+        token = _current_node_index.set(index)
         
         # 执行节点
         try:
-            result = await handler.execute(context, config)
+            result = await execute(context, config)
             return result
         except Exception as e:
             raise RPANodeError(f"Node execution error: {str(e)}", node_index=index, node_type=node_type)
+        finally:
+            _current_node_index.reset(token)
     
     async def _start_browser(self, context: RPAExecutionContext) -> Dict:
         """启动浏览器"""
         
         try:
-            async with adspower_client as client:
-                response = await client.start_browser(context.profile.adspower_id)
-                
-                if not client.is_success_response(response):
-                    raise RPANodeError(f"Failed to start browser: {client.get_error_message(response)}")
-                
-                browser_data = response["data"]
-                context.add_log("info", f"Browser started for profile {context.profile.name}")
-                
-                return browser_data
+            client = context.adspower
+            response = await client.start_browser(context.profile.adspower_id)
+            
+            if not client.is_success_response(response):
+                raise RPANodeError(f"Failed to start browser: {client.get_error_message(response)}")
+            
+            browser_data = response["data"]
+            context.add_log("info", "Browser started for profile %s", context.profile.name)
+            
+            return browser_data
                 
         except Exception as e:
             raise RPANodeError(f"Browser startup failed: {str(e)}")
@@ -1269,11 +1909,10 @@ class RPAEngine:
         
         try:
             if context.browser_data:
-                async with adspower_client as client:
-                    await client.stop_browser(context.profile.adspower_id)
-                    context.add_log("info", "Browser stopped")
+                await context.adspower.stop_browser(context.profile.adspower_id)
+                context.add_log("info", "Browser stopped")
         except Exception as e:
-            context.add_log("warning", f"Failed to stop browser: {str(e)}")
+            context.add_log("warning", "Failed to stop browser: %s", e)
 
 
 # 全局RPA引擎实例
@@ -2,29 +2,63 @@
 任务调度服务
 """
 import asyncio
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+import heapq
+import time
+import weakref
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, select, text, update
 import structlog
 
 from app.models.task import Task
 from app.models.profile import Profile
 from app.models.rpa import RPAFlow
 from app.models.user import User
-from app.services.rpa_engine import rpa_engine, RPAExecutionContext, RPANodeError
-from app.core.database import SessionLocal
+from app.services.rpa_engine import rpa_engine, context_pool, RPANodeError
+from app.core.database import AsyncSessionLocal, async_engine
 from app.services.websocket_manager import task_notifier
 
 logger = structlog.get_logger()
 
+# 定时任务创建后通过该频道通知其他工作进程
+TASK_SCHEDULED_CHANNEL = "task_scheduled"
+# 兜底全量加载定时任务的间隔（秒），覆盖LISTEN连接断开期间漏掉的通知
+SCHEDULE_RELOAD_INTERVAL = 60
+# 已认领（queued）任务的租约时长（秒）：认领者每次全量加载时续约，
+# 超时未续约（进程退出等）的认领会被放回待执行状态
+QUEUED_LEASE_SECONDS = 5 * SCHEDULE_RELOAD_INTERVAL
+
+
+def _due_timestamp(scheduled_at: datetime) -> float:
+    """将调度时间转换为时间戳（无时区的时间按UTC处理）"""
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+    return scheduled_at.timestamp()
+
 
 class TaskScheduler:
     """任务调度器"""
     
     def __init__(self):
-        self.running_tasks = {}  # task_id -> asyncio.Task
+        # task_id -> asyncio.Task（包含排队等待中的任务）；任务由 TaskGroup 持有，
+        # 结束后条目自动消失
+        self.running_tasks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        # 已取得并发名额、正在执行的任务ID（其余活动任务处于排队状态）
+        self._executing: Set[int] = set()
+        # 托管所有任务执行的 TaskGroup，由 run() 创建
+        self._task_group: Optional[asyncio.TaskGroup] = None
         self.max_concurrent_tasks = 10
+        # 并发执行名额，超出的任务排队等待
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_tasks)
+        # 定时任务最小堆：(到期时间戳, task_id)
+        self._due_heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}  # task_id -> 到期时间戳
+        # 收到通知但尚未加载的任务ID
+        self._notified_ids: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        # LISTEN 专用连接，断开后由调度循环重建
+        self._listen_conn = None
         
     async def create_task(
         self,
@@ -74,6 +108,15 @@ class TaskScheduler:
         )
         
         db.add(task)
+        db.flush()
+        
+        if scheduled_at and db.bind.dialect.name == "postgresql":
+            # 事务提交时通知所有工作进程
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": TASK_SCHEDULED_CHANNEL, "payload": str(task.id)}
+            )
+        
         db.commit()
         db.refresh(task)
         
@@ -88,72 +131,124 @@ class TaskScheduler:
         # 如果没有设置调度时间，立即执行
         if not scheduled_at:
             await self.execute_task(task.id)
+        else:
+            self._schedule(task.id, scheduled_at)
         
         return task
     
+    async def run(self):
+        """调度器主协程：在 TaskGroup 中托管任务执行并调度定时任务"""
+        async with asyncio.TaskGroup() as tg:
+            self._task_group = tg
+            try:
+                await self.schedule_periodic_tasks()
+            finally:
+                self._task_group = None
+    
+    @property
+    def is_running(self) -> bool:
+        """调度器是否在运行（可以接收新的执行请求）"""
+        return self._task_group is not None
+    
+    def _active_task(self, task_id: int) -> Optional[asyncio.Task]:
+        """获取任务对应的未结束的异步任务"""
+        async_task = self.running_tasks.get(task_id)
+        if async_task is None or async_task.done():
+            return None
+        return async_task
+    
     async def execute_task(self, task_id: int) -> bool:
         """执行任务"""
         
-        if task_id in self.running_tasks:
-            logger.warning("Task already running", task_id=task_id)
+        if self._task_group is None:
+            logger.warning("Task scheduler is not running", task_id=task_id)
             return False
         
-        if len(self.running_tasks) >= self.max_concurrent_tasks:
-            logger.warning("Max concurrent tasks reached", task_id=task_id)
+        if self._active_task(task_id) is not None:
+            logger.warning("Task already running", task_id=task_id)
             return False
         
-        # 创建异步任务
-        async_task = asyncio.create_task(self._execute_task_async(task_id))
-        self.running_tasks[task_id] = async_task
+        # 创建异步任务（并发名额已满时在任务内部排队）
+        self.running_tasks[task_id] = self._task_group.create_task(
+            self._execute_task_async(task_id), name=f"task-{task_id}"
+        )
         
         return True
     
     async def _execute_task_async(self, task_id: int):
-        """异步执行任务"""
+        """异步执行任务，并发名额不足时排队等待
+        
+        任务运行在共享的 TaskGroup 中，任何异常都必须在此处理，
+        否则会取消其他正在执行的任务并使调度器退出。
+        """
+        try:
+            async with self._semaphore:
+                self._executing.add(task_id)
+                try:
+                    await self._run_task(task_id)
+                finally:
+                    self._executing.discard(task_id)
+        except Exception as e:
+            logger.error("Unhandled error in task execution", task_id=task_id, error=str(e))
+    
+    async def _run_task(self, task_id: int):
+        """执行任务并记录结果"""
         
-        db = SessionLocal()
+        db = AsyncSessionLocal()
+        task = profile = rpa_flow = context = None
         
         try:
-            # 获取任务信息
-            task = db.query(Task).filter(Task.id == task_id).first()
-            if not task:
+            # 一次查询取回任务及其profile和RPA流程
+            row = (await db.execute(
+                select(Task, Profile, RPAFlow)
+                .outerjoin(Profile, Profile.id == Task.profile_id)
+                .outerjoin(RPAFlow, RPAFlow.id == Task.rpa_flow_id)
+                .where(Task.id == task_id)
+            )).first()
+            if not row:
                 logger.error("Task not found", task_id=task_id)
                 return
             
-            profile = db.query(Profile).filter(Profile.id == task.profile_id).first()
-            rpa_flow = db.query(RPAFlow).filter(RPAFlow.id == task.rpa_flow_id).first()
+            task, profile, rpa_flow = row
+            
+            # 排队期间已被取消
+            if task.status == "cancelled":
+                logger.info("Task cancelled before execution", task_id=task_id)
+                return
             
             if not profile or not rpa_flow:
                 logger.error("Profile or RPA flow not found", task_id=task_id)
                 task.complete_execution(False, error="Profile or RPA flow not found")
-                db.commit()
+                await db.commit()
                 return
             
             # 检查profile状态
             if not profile.can_launch:
                 logger.error("Profile cannot be launched", task_id=task_id, profile_status=profile.status)
                 task.complete_execution(False, error=f"Profile cannot be launched: {profile.status}")
-                db.commit()
+                await db.commit()
                 return
             
             # 开始执行
             task.start_execution()
-            db.commit()
+            await db.commit()
+            # 加载数据库生成的开始时间
+            await db.refresh(task)
 
             logger.info("Task execution started", task_id=task_id)
 
             # 通知WebSocket客户端任务开始
             await task_notifier.notify_task_started(task_id, task.to_dict())
             
-            # 创建执行上下文
-            context = RPAExecutionContext(task, profile, rpa_flow)
+            # 从对象池取出执行上下文
+            context = context_pool.acquire(task, profile, rpa_flow)
             
             # 执行RPA流程
             result = await rpa_engine.execute_flow(context)
             
             # 更新任务结果
             task.complete_execution(True, result=result)
-            task.logs = context.execution_logs
+            task.logs = context.format_logs()
 
             # 更新RPA流程统计
             rpa_flow.increment_execution(True)
@@ -161,30 +256,34 @@ class TaskScheduler:
             # 更新profile状态
             profile.update_status("inactive")
 
-            db.commit()
+            await db.commit()
 
             logger.info("Task execution completed successfully", task_id=task_id)
 
             # 通知WebSocket客户端任务完成
-            await task_notifier.notify_task_completed(task_id, result)
+            # 日志已在执行过程中增量推送，完成通知不再携带全量日志
+            await task_notifier.notify_task_completed(
+                task_id, {key: value for key, value in result.items() if key != "logs"}
+            )
             
         except RPANodeError as e:
             # RPA节点执行错误
-            task.complete_execution(False, error=e.message)
-            task.error_node_index = e.node_index
-            
-            if hasattr(context, 'execution_logs'):
-                task.logs = context.execution_logs
+            if task is not None:
+                task.complete_execution(False, error=e.message)
+                task.error_node_index = e.node_index
+                
+                if context is not None:
+                    task.logs = context.format_logs()
             
             # 更新RPA流程统计
-            if 'rpa_flow' in locals():
+            if rpa_flow is not None:
                 rpa_flow.increment_execution(False)
             
             # 更新profile状态
-            if 'profile' in locals():
+            if profile is not None:
                 profile.update_status("inactive")
             
-            db.commit()
+            await db.commit()
             
             logger.error(
                 "Task execution failed with RPA error",
@@ -199,20 +298,21 @@ class TaskScheduler:
             
         except Exception as e:
             # 其他错误
-            task.complete_execution(False, error=str(e))
-            
-            if hasattr(context, 'execution_logs'):
-                task.logs = context.execution_logs
+            if task is not None:
+                task.complete_execution(False, error=str(e))
+                
+                if context is not None:
+                    task.logs = context.format_logs()
             
             # 更新RPA流程统计
-            if 'rpa_flow' in locals():
+            if rpa_flow is not None:
                 rpa_flow.increment_execution(False)
             
             # 更新profile状态
-            if 'profile' in locals():
+            if profile is not None:
                 profile.update_status("inactive")
             
-            db.commit()
+            await db.commit()
             
             logger.error("Task execution failed", task_id=task_id, error=str(e))
 
@@ -221,57 +321,58 @@ class TaskScheduler:
             
         finally:
             # 清理
-            if task_id in self.running_tasks:
-                del self.running_tasks[task_id]
+            await db.close()
             
-            db.close()
+            if context is not None:
+                context_pool.release(context)
+
     
     async def cancel_task(self, task_id: int) -> bool:
         """取消任务"""
         
-        if task_id in self.running_tasks:
-            async_task = self.running_tasks[task_id]
+        async_task = self._active_task(task_id)
+        if async_task is not None:
             async_task.cancel()
+        
+        # 更新数据库状态
+        async with AsyncSessionLocal() as db:
+            task = await db.get(Task, task_id)
+            # 不在本进程执行的任务只能取消已认领、尚未开始执行的（其执行者可能已退出）
+            if not task or (async_task is None and task.status != "queued"):
+                return async_task is not None
             
-            # 更新数据库状态
-            db = SessionLocal()
-            try:
-                task = db.query(Task).filter(Task.id == task_id).first()
-                if task:
-                    task.status = "cancelled"
-                    task.completed_at = datetime.utcnow()
-                    db.commit()
-                    
-                logger.info("Task cancelled", task_id=task_id)
-                return True
-                
-            finally:
-                db.close()
+            task.status = "cancelled"
+            task.completed_at = datetime.utcnow()
+            await db.commit()
         
-        return False
+        logger.info("Task cancelled", task_id=task_id)
+        return True
     
     def get_running_tasks(self) -> List[int]:
-        """获取正在运行的任务ID列表"""
-        return list(self.running_tasks.keys())
+        """获取正在运行的任务ID列表（不含排队等待并发名额的任务）"""
+        return [task_id for task_id in self._executing if self._active_task(task_id) is not None]
     
-    def get_task_status(self, task_id: int) -> str:
+    def get_queued_tasks(self) -> List[int]:
+        """获取排队等待并发名额的任务ID列表"""
+        return [
+            task_id for task_id, async_task in self.running_tasks.items()
+            if not async_task.done() and task_id not in self._executing
+        ]
+    
+    async def get_task_status(self, task_id: int) -> str:
         """获取任务状态"""
-        if task_id in self.running_tasks:
-            return "running"
+        if self._active_task(task_id) is not None:
+            return "running" if task_id in self._executing else "queued"
         
-        db = SessionLocal()
-        try:
-            task = db.query(Task).filter(Task.id == task_id).first()
-            return task.status if task else "not_found"
-        finally:
-            db.close()
+        async with AsyncSessionLocal() as db:
+            status = await db.scalar(select(Task.status).where(Task.id == task_id))
+            return status if status else "not_found"
     
     async def retry_task(self, task_id: int) -> bool:
         """重试任务"""
         
-        db = SessionLocal()
-        try:
-            task = db.query(Task).filter(Task.id == task_id).first()
+        async with AsyncSessionLocal() as db:
+            task = await db.get(Task, task_id)
             if not task:
                 return False
             
@@ -288,44 +389,207 @@ class TaskScheduler:
             task.started_at = None
             task.completed_at = None
             
-            db.commit()
-            
-            # 重新执行
-            return await self.execute_task(task_id)
+            await db.commit()
+        
+        # 重新执行
+        return await self.execute_task(task_id)
+    
+    def _schedule(self, task_id: int, scheduled_at: datetime):
+        """将定时任务加入到期堆并唤醒调度循环"""
+        due = _due_timestamp(scheduled_at)
+        if self._scheduled.get(task_id) == due:
+            return
+        
+        self._scheduled[task_id] = due
+        heapq.heappush(self._due_heap, (due, task_id))
+        self._wakeup.set()
+    
+    def _on_task_scheduled(self, connection, pid, channel, payload):
+        """LISTEN回调：记录新调度的任务，由调度循环统一加载"""
+        try:
+            self._notified_ids.add(int(payload))
+        except ValueError:
+            return
+        self._wakeup.set()
+    
+    async def _load_scheduled_tasks(self, task_ids: Optional[Set[int]] = None):
+        """从数据库加载待执行的定时任务（不指定ID时加载全部）"""
+        query = select(Task.id, Task.scheduled_at).where(
+            and_(
+                Task.status == "pending",
+                Task.scheduled_at.isnot(None)
+            )
+        )
+        if task_ids is not None:
+            query = query.where(Task.id.in_(task_ids))
+        
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        
+        for task_id, scheduled_at in rows:
+            self._schedule(task_id, scheduled_at)
+    
+    async def _run_due_tasks(self):
+        """执行已到期的定时任务"""
+        now = time.time()
+        due_items = []
+        while self._due_heap and self._due_heap[0][0] <= now:
+            due, task_id = heapq.heappop(self._due_heap)
+            # 跳过已被重新调度的旧条目
+            if self._scheduled.get(task_id) != due:
+                continue
+            del self._scheduled[task_id]
+            due_items.append((due, task_id))
+        
+        if not due_items:
+            return
+        
+        # 原子地认领仍处于待执行状态的任务，多个工作进程同时到期时只有一个能认领成功
+        due_ids = [task_id for _, task_id in due_items]
+        try:
+            async with AsyncSessionLocal() as db:
+                pending_ids = (await db.scalars(
+                    update(Task)
+                    .where(and_(Task.id.in_(due_ids), Task.status == "pending"))
+                    .values(status="queued")
+                    .returning(Task.id)
+                )).all()
+                await db.commit()
+        except Exception:
+            # 查询失败时放回堆中，下次唤醒重试
+            for due, task_id in due_items:
+                self._scheduled[task_id] = due
+                heapq.heappush(self._due_heap, (due, task_id))
+            raise
+        
+        rejected_ids = [task_id for task_id in pending_ids if not await self.execute_task(task_id)]
+        if rejected_ids:
+            # 未能执行的认领放回待执行状态，否则任务会一直停留在 queued
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Task)
+                    .where(and_(Task.id.in_(rejected_ids), Task.status == "queued"))
+                    .values(status="pending")
+                )
+                await db.commit()
+    
+    async def _recover_queued_tasks(self):
+        """为本进程持有的认领续约，并将租约过期的认领放回待执行状态"""
+        active_ids = [task_id for task_id in list(self.running_tasks.keys()) if self._active_task(task_id) is not None]
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=QUEUED_LEASE_SECONDS)
+        
+        async with AsyncSessionLocal() as db:
+            if active_ids:
+                # 认领时间记录在 updated_at 中，任意更新都会刷新它
+                await db.execute(
+                    update(Task)
+                    .where(and_(Task.id.in_(active_ids), Task.status == "queued"))
+                    .values(status="queued")
+                )
             
-        finally:
-            db.close()
+            recovered_ids = (await db.scalars(
+                update(Task)
+                .where(and_(
+                    Task.status == "queued",
+                    Task.updated_at < cutoff,
+                    Task.id.not_in(active_ids)
+                ))
+                .values(status="pending")
+                .returning(Task.id)
+            )).all()
+            await db.commit()
+        
+        if recovered_ids:
+            logger.warning("Recovered stale queued tasks", task_ids=recovered_ids)
+    
+    def _next_delay(self, last_reload: float) -> float:
+        """距下一次需要唤醒（定时任务到期或兜底全量加载）的秒数"""
+        delay = max(0.0, SCHEDULE_RELOAD_INTERVAL - (time.monotonic() - last_reload))
+        if self._due_heap:
+            delay = min(delay, max(0.0, self._due_heap[0][0] - time.time()))
+        return delay
+    
+    async def _ensure_listener(self) -> bool:
+        """建立LISTEN连接，断开后重建；返回是否新建了连接"""
+        if self._listen_conn is not None:
+            raw_conn = await self._listen_conn.get_raw_connection()
+            if not raw_conn.driver_connection.is_closed():
+                return False
+            await self._close_listener()
+        
+        conn = await async_engine.connect()
+        try:
+            raw_conn = await conn.get_raw_connection()
+            await raw_conn.driver_connection.add_listener(
+                TASK_SCHEDULED_CHANNEL, self._on_task_scheduled
+            )
+        except Exception:
+            await conn.close()
+            raise
+        
+        self._listen_conn = conn
+        return True
+    
+    async def _close_listener(self):
+        """关闭LISTEN连接（连接已断开时直接丢弃）"""
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            await conn.invalidate()
+            await conn.close()
+        except Exception as e:
+            logger.warning("Failed to close listen connection", error=str(e))
     
     async def schedule_periodic_tasks(self):
-        """调度定期任务"""
+        """调度定期任务
         
-        while True:
-            try:
-                db = SessionLocal()
-                
-                # 查找需要执行的定时任务
-                now = datetime.utcnow()
-                pending_tasks = db.query(Task).filter(
-                    and_(
-                        Task.status == "pending",
-                        Task.scheduled_at <= now,
-                        Task.scheduled_at.isnot(None)
-                    )
-                ).limit(10).all()
+        定时任务保存在按到期时间排序的最小堆中，循环在最早的任务到期、
+        或有新任务调度（本进程或LISTEN通知）时被唤醒。LISTEN连接断开时
+        自动重建，并按 SCHEDULE_RELOAD_INTERVAL 兜底全量加载，同时回收
+        租约过期的认领。
+        """
+        
+        listen = async_engine.dialect.name == "postgresql"
+        # 上次全量加载的时间，-inf 表示尚未加载
+        last_reload = float("-inf")
+        
+        try:
+            while True:
+                self._wakeup.clear()
                 
-                for task in pending_tasks:
-                    if len(self.running_tasks) < self.max_concurrent_tasks:
-                        await self.execute_task(task.id)
-                    else:
-                        break
+                if listen:
+                    try:
+                        # 重新建立监听后，断开期间的通知可能已丢失，需全量加载
+                        if await self._ensure_listener():
+                            last_reload = float("-inf")
+                    except Exception as e:
+                        # 监听失败时仍可调度本进程创建的定时任务，并依赖兜底加载
+                        logger.error("Failed to listen for scheduled tasks", error=str(e))
                 
-                db.close()
+                try:
+                    if time.monotonic() - last_reload >= SCHEDULE_RELOAD_INTERVAL:
+                        await self._recover_queued_tasks()
+                        await self._load_scheduled_tasks()
+                        last_reload = time.monotonic()
+                    
+                    if self._notified_ids:
+                        task_ids, self._notified_ids = self._notified_ids, set()
+                        await self._load_scheduled_tasks(task_ids)
+                    
+                    await self._run_due_tasks()
+                    
+                except Exception as e:
+                    logger.error("Error in periodic task scheduling", error=str(e))
+                    # 出错后稍等再重试，避免数据库不可用时空转
+                    await asyncio.sleep(5)
                 
-            except Exception as e:
-                logger.error("Error in periodic task scheduling", error=str(e))
-            
-            # 每30秒检查一次
-            await asyncio.sleep(30)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_delay(last_reload))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._close_listener()
 
 
 # 全局任务调度器实例
@@ -1,30 +1,97 @@
 """
 WebSocket连接管理器
 """
-import json
 import asyncio
+import time
+from array import array
 from typing import Dict, List, Set, Any, Optional
 from fastapi import WebSocket, WebSocketDisconnect
+import orjson
 import structlog
 
 logger = structlog.get_logger()
 
 
+def encode_message(message: Dict[str, Any]) -> str:
+    """序列化WebSocket消息（orjson输出UTF-8，等价于ensure_ascii=False）"""
+    return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+# 估计序列化后超过该字节数的消息在线程中序列化
+LARGE_PAYLOAD_BYTES = 64 * 1024
+
+
+def _estimate_json_size(value: Any, limit: int) -> int:
+    """粗略估计值序列化为JSON后的字节数，超过 limit 时提前返回"""
+    size = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            size += len(item) + 2
+        elif isinstance(item, dict):
+            size += 2
+            for key, child in item.items():
+                size += len(str(key)) + 4
+                stack.append(child)
+        elif isinstance(item, (list, tuple)):
+            size += 2 + len(item)
+            stack.extend(item)
+        else:
+            # 数字、布尔值、None 等标量
+            size += 8
+        
+        if size > limit:
+            break
+    return size
+
+
+def _is_large_update(update: Dict[str, Any]) -> bool:
+    """任务更新序列化后是否超过 LARGE_PAYLOAD_BYTES"""
+    return _estimate_json_size(update, LARGE_PAYLOAD_BYTES) > LARGE_PAYLOAD_BYTES
+
+
 class ConnectionManager:
     """WebSocket连接管理器"""
     
+    # 每帧最多合并的消息数
+    BATCH_SIZE = 128
+    # 每个连接发送队列的容量上限
+    QUEUE_SIZE = 1024
+    # 队列满时可丢弃的任务更新状态（started/completed/failed 始终保留）
+    DROPPABLE_STATUSES = frozenset({"progress", "logs"})
+    
     def __init__(self):
-        # 存储所有活跃连接
-        self.active_connections: Dict[str, WebSocket] = {}
+        # 连接ID -> 连接槽位（紧凑的整数下标，断开后回收复用）
+        self.connection_slots: Dict[str, int] = {}
+        self.free_slots: List[int] = []
+        # 按槽位索引的连接状态（并行数组）：是否存活、WebSocket、发送协程、
+        # 待发送队列（已序列化的消息）、消息序号、自上次发送以来丢弃的消息数
+        self.alive = bytearray()
+        self.websockets: List[Optional[WebSocket]] = []
+        self.writer_tasks: List[Optional[asyncio.Task]] = []
+        self.send_queues: List[Optional[asyncio.Queue]] = []
+        self.seq: List[int] = []
+        self.dropped: List[int] = []
+        # 槽位订阅的任务（task_subscribers 的反向索引，断开时只需处理相关任务）
+        self.slot_tasks: List[Set[int]] = []
         # 用户订阅的任务
         self.user_subscriptions: Dict[int, Set[str]] = {}  # user_id -> set of connection_ids
         # 任务订阅者
-        self.task_subscribers: Dict[int, Set[str]] = {}  # task_id -> set of connection_ids
+        self.task_subscribers: Dict[int, Set[int]] = {}  # task_id -> set of connection slots
+        # 订阅者槽位的连续数组快照，订阅变化时失效，推送时按需重建
+        self.subscriber_arrays: Dict[int, array] = {}
         
     async def connect(self, websocket: WebSocket, connection_id: str, user_id: int):
         """接受WebSocket连接"""
         await websocket.accept()
-        self.active_connections[connection_id] = websocket
+        
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        slot = self._allocate_slot(websocket, queue)
+        self.connection_slots[connection_id] = slot
+        self.writer_tasks[slot] = asyncio.create_task(
+            self._writer(connection_id, slot, websocket, queue)
+        )
         
         # 初始化用户订阅
         if user_id not in self.user_subscriptions:
@@ -35,20 +102,19 @@ class ConnectionManager:
             "WebSocket connected",
             connection_id=connection_id,
             user_id=user_id,
-            total_connections=len(self.active_connections)
+            total_connections=len(self.connection_slots)
         )
         
         # 发送连接成功消息
         await self.send_personal_message(connection_id, {
             "type": "connection_established",
             "connection_id": connection_id,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": time.monotonic()
         })
     
     def disconnect(self, connection_id: str, user_id: int):
         """断开WebSocket连接"""
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
+        self._close_connection(connection_id)
         
         # 清理用户订阅
         if user_id in self.user_subscriptions:
@@ -56,57 +122,172 @@ class ConnectionManager:
             if not self.user_subscriptions[user_id]:
                 del self.user_subscriptions[user_id]
         
-        # 清理任务订阅
-        for task_id, subscribers in self.task_subscribers.items():
-            subscribers.discard(connection_id)
-        
-        # 清理空的任务订阅
-        empty_tasks = [task_id for task_id, subscribers in self.task_subscribers.items() if not subscribers]
-        for task_id in empty_tasks:
-            del self.task_subscribers[task_id]
-        
         logger.info(
             "WebSocket disconnected",
             connection_id=connection_id,
             user_id=user_id,
-            total_connections=len(self.active_connections)
+            total_connections=len(self.connection_slots)
         )
     
-    async def send_personal_message(self, connection_id: str, message: Dict[str, Any]):
+    def _allocate_slot(self, websocket: WebSocket, queue: asyncio.Queue) -> int:
+        """为新连接分配槽位，优先复用已释放的槽位"""
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.alive[slot] = 1
+            self.websockets[slot] = websocket
+            self.send_queues[slot] = queue
+            self.seq[slot] = 0
+            self.dropped[slot] = 0
+        else:
+            slot = len(self.send_queues)
+            self.alive.append(1)
+            self.websockets.append(websocket)
+            self.writer_tasks.append(None)
+            self.send_queues.append(queue)
+            self.seq.append(0)
+            self.dropped.append(0)
+            self.slot_tasks.append(set())
+        return slot
+    
+    async def send_personal_message(self, connection_id: str, message: Dict[str, Any], droppable: bool = False):
         """发送个人消息"""
-        if connection_id in self.active_connections:
-            websocket = self.active_connections[connection_id]
+        if connection_id in self.connection_slots:
+            await self._send_raw(connection_id, encode_message(message), droppable)
+    
+    async def _send_raw(self, connection_id: str, data: str, droppable: bool = False):
+        """将已序列化的消息放入连接的发送队列"""
+        slot = self.connection_slots.get(connection_id)
+        if slot is not None:
+            self._enqueue(slot, data, droppable)
+    
+    def _enqueue(self, slot: int, data: str, droppable: bool = False):
+        """将已序列化的消息放入槽位对应的发送队列
+        
+        队列满时不阻塞生产者：优先丢弃最早的可丢弃消息（进度/日志），
+        并在下一帧中告知客户端丢弃的数量。
+        """
+        queue = self.send_queues[slot]
+        if queue is None:
+            return
+        
+        self.seq[slot] += 1
+        item = (self.seq[slot], droppable, data)
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        
+        pending = [queue.get_nowait() for _ in range(queue.qsize())]
+        for i, (_, pending_droppable, _) in enumerate(pending):
+            if pending_droppable:
+                del pending[i]
+                break
+        else:
+            if droppable:
+                # 队列中全是关键消息，丢弃新的可丢弃消息
+                item = None
+            else:
+                del pending[0]
+        
+        self.dropped[slot] += 1
+        if item is not None:
+            pending.append(item)
+        for pending_item in pending:
+            queue.put_nowait(pending_item)
+    
+    async def _writer(self, connection_id: str, slot: int, websocket: WebSocket, queue: asyncio.Queue):
+        """连接的发送协程，将积压的多条消息合并为一帧发送"""
+        while True:
+            items = [await queue.get()]
+            while len(items) < self.BATCH_SIZE and not queue.empty():
+                items.append(queue.get_nowait())
+            
+            dropped = self.dropped[slot]
+            self.dropped[slot] = 0
+            
+            if len(items) == 1 and not dropped:
+                data = items[0][2]
+            else:
+                # 消息已是JSON文本，直接拼接为批量帧，无需重新序列化；
+                # 帧头携带序号与丢弃数，客户端据此发现缺口，时间戳每帧只取一次
+                data = (
+                    '{"type":"batch","timestamp":%r,"last_seq":%d,"dropped_since_last":%d,"items":[%s]}'
+                    % (time.monotonic(), items[-1][0], dropped, ",".join(item[2] for item in items))
+                )
+            
             try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
+                await websocket.send_text(data)
             except Exception as e:
                 logger.error(
                     "Failed to send personal message",
                     connection_id=connection_id,
                     error=str(e)
                 )
-                # 连接可能已断开，清理连接
-                if connection_id in self.active_connections:
-                    del self.active_connections[connection_id]
+                # 连接可能已断开，清理连接（当前协程即将退出，无需取消自身）
+                self.writer_tasks[slot] = None
+                self._close_connection(connection_id)
+                return
+    
+    def _close_connection(self, connection_id: str):
+        """移除连接及其任务订阅，回收槽位并停止发送协程"""
+        slot = self.connection_slots.pop(connection_id, None)
+        if slot is None:
+            return
+        
+        # 槽位会被复用，回收前必须清理其任务订阅
+        for task_id in self.slot_tasks[slot]:
+            self.subscriber_arrays.pop(task_id, None)
+            subscribers = self.task_subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(slot)
+                if not subscribers:
+                    del self.task_subscribers[task_id]
+        self.slot_tasks[slot].clear()
+        
+        writer_task = self.writer_tasks[slot]
+        if writer_task is not None:
+            writer_task.cancel()
+        
+        self.alive[slot] = 0
+        self.websockets[slot] = None
+        self.writer_tasks[slot] = None
+        self.send_queues[slot] = None
+        self.free_slots.append(slot)
     
     async def send_to_user(self, user_id: int, message: Dict[str, Any]):
         """发送消息给指定用户的所有连接"""
         if user_id in self.user_subscriptions:
+            # 只序列化一次，该用户的所有连接共用
+            data = encode_message(message)
             connection_ids = list(self.user_subscriptions[user_id])
             for connection_id in connection_ids:
-                await self.send_personal_message(connection_id, message)
+                await self._send_raw(connection_id, data)
     
     async def broadcast_to_all(self, message: Dict[str, Any]):
         """广播消息给所有连接"""
-        if self.active_connections:
-            connection_ids = list(self.active_connections.keys())
-            for connection_id in connection_ids:
-                await self.send_personal_message(connection_id, message)
+        if self.connection_slots:
+            # 只序列化一次，所有连接共用
+            await self.broadcast_raw(encode_message(message))
+    
+    async def broadcast_raw(self, data: str):
+        """广播已序列化的消息给所有连接"""
+        alive = self.alive
+        for slot in range(len(alive)):
+            if alive[slot]:
+                self._enqueue(slot, data)
     
     def subscribe_to_task(self, connection_id: str, task_id: int):
         """订阅任务更新"""
+        slot = self.connection_slots.get(connection_id)
+        if slot is None:
+            return
+        
         if task_id not in self.task_subscribers:
             self.task_subscribers[task_id] = set()
-        self.task_subscribers[task_id].add(connection_id)
+        self.task_subscribers[task_id].add(slot)
+        self.slot_tasks[slot].add(task_id)
+        self.subscriber_arrays.pop(task_id, None)
         
         logger.info(
             "Subscribed to task",
@@ -116,10 +297,14 @@ class ConnectionManager:
     
     def unsubscribe_from_task(self, connection_id: str, task_id: int):
         """取消订阅任务更新"""
-        if task_id in self.task_subscribers:
-            self.task_subscribers[task_id].discard(connection_id)
-            if not self.task_subscribers[task_id]:
-                del self.task_subscribers[task_id]
+        slot = self.connection_slots.get(connection_id)
+        if slot is not None:
+            self.slot_tasks[slot].discard(task_id)
+            self.subscriber_arrays.pop(task_id, None)
+            if task_id in self.task_subscribers:
+                self.task_subscribers[task_id].discard(slot)
+                if not self.task_subscribers[task_id]:
+                    del self.task_subscribers[task_id]
         
         logger.info(
             "Unsubscribed from task",
@@ -134,26 +319,43 @@ class ConnectionManager:
                 "type": "task_update",
                 "task_id": task_id,
                 "data": update,
-                "timestamp": asyncio.get_event_loop().time()
+                "timestamp": time.monotonic()
             }
             
-            connection_ids = list(self.task_subscribers[task_id])
-            for connection_id in connection_ids:
-                await self.send_personal_message(connection_id, message)
+            droppable = update.get("status") in self.DROPPABLE_STATUSES
+            # 只序列化一次，所有订阅者共用；按槽位直接定位发送队列
+            if _is_large_update(update):
+                # 大结果在线程中序列化，避免阻塞其他任务的进度推送
+                data = await asyncio.to_thread(encode_message, message)
+            else:
+                data = encode_message(message)
+            
+            # 在线程中序列化期间订阅者可能已全部退订或断开
+            subscribers = self.task_subscribers.get(task_id)
+            if not subscribers:
+                return
+            
+            slots = self.subscriber_arrays.get(task_id)
+            if slots is None:
+                slots = self.subscriber_arrays[task_id] = array("I", sorted(subscribers))
+            alive = self.alive
+            for slot in slots:
+                if alive[slot]:
+                    self._enqueue(slot, data, droppable)
     
     async def send_system_notification(self, user_id: int, notification: Dict[str, Any]):
         """发送系统通知"""
         message = {
             "type": "system_notification",
             "data": notification,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": time.monotonic()
         }
         await self.send_to_user(user_id, message)
     
     def get_connection_stats(self) -> Dict[str, Any]:
         """获取连接统计信息"""
         return {
-            "total_connections": len(self.active_connections),
+            "total_connections": len(self.connection_slots),
             "total_users": len(self.user_subscriptions),
             "total_task_subscriptions": len(self.task_subscribers),
             "connections_per_user": {
@@ -170,8 +372,31 @@ connection_manager = ConnectionManager()
 class TaskUpdateNotifier:
     """任务更新通知器"""
     
+    # 进度通知的合并窗口（秒），窗口内只发送最新进度
+    PROGRESS_DEBOUNCE = 0.05
+    
     def __init__(self, manager: ConnectionManager):
         self.manager = manager
+        # 每个任务待发送的最新进度及延迟发送协程
+        self._pending_progress: Dict[int, Dict[str, Any]] = {}
+        self._progress_flushers: Dict[int, asyncio.Task] = {}
+    
+    async def _flush_progress_later(self, task_id: int):
+        """合并窗口结束后发送最新进度"""
+        await asyncio.sleep(self.PROGRESS_DEBOUNCE)
+        self._progress_flushers.pop(task_id, None)
+        update = self._pending_progress.pop(task_id, None)
+        if update is not None:
+            await self.manager.send_task_update(task_id, update)
+    
+    async def _flush_progress_now(self, task_id: int):
+        """立即发送尚未发出的进度，保证其先于终态通知到达"""
+        flusher = self._progress_flushers.pop(task_id, None)
+        if flusher is not None:
+            flusher.cancel()
+        update = self._pending_progress.pop(task_id, None)
+        if update is not None:
+            await self.manager.send_task_update(task_id, update)
     
     async def notify_task_started(self, task_id: int, task_data: Dict[str, Any]):
         """通知任务开始"""
@@ -181,16 +406,19 @@ class TaskUpdateNotifier:
         })
     
     async def notify_task_progress(self, task_id: int, progress: int, current_node: int, message: str = None):
-        """通知任务进度"""
-        await self.manager.send_task_update(task_id, {
+        """通知任务进度（合并窗口内的多次更新只发送最后一次）"""
+        self._pending_progress[task_id] = {
             "status": "progress",
             "progress": progress,
             "current_node": current_node,
             "message": message
-        })
+        }
+        if task_id not in self._progress_flushers:
+            self._progress_flushers[task_id] = asyncio.create_task(self._flush_progress_later(task_id))
     
     async def notify_task_completed(self, task_id: int, result: Dict[str, Any]):
         """通知任务完成"""
+        await self._flush_progress_now(task_id)
         await self.manager.send_task_update(task_id, {
             "status": "completed",
             "result": result
@@ -198,17 +426,18 @@ class TaskUpdateNotifier:
     
     async def notify_task_failed(self, task_id: int, error: str, node_index: int = None):
         """通知任务失败"""
+        await self._flush_progress_now(task_id)
         await self.manager.send_task_update(task_id, {
             "status": "failed",
             "error": error,
             "error_node_index": node_index
         })
     
-    async def notify_task_log(self, task_id: int, log_entry: Dict[str, Any]):
-        """通知任务日志"""
+    async def notify_task_logs(self, task_id: int, log_entries: List[Dict[str, Any]]):
+        """通知任务日志（一批日志合并为一条消息）"""
         await self.manager.send_task_update(task_id, {
-            "status": "log",
-            "log": log_entry
+            "status": "logs",
+            "logs": log_entries
         })
 
 
@@ -216,45 +445,66 @@ class TaskUpdateNotifier:
 task_notifier = TaskUpdateNotifier(connection_manager)
 
 
-async def handle_websocket_message(connection_id: str, user_id: int, message: Dict[str, Any]):
-    """处理WebSocket消息"""
-    message_type = message.get("type")
-    
-    if message_type == "subscribe_task":
-        task_id = message.get("task_id")
-        if task_id:
-            connection_manager.subscribe_to_task(connection_id, task_id)
-            await connection_manager.send_personal_message(connection_id, {
-                "type": "subscription_confirmed",
-                "task_id": task_id
-            })
-    
-    elif message_type == "unsubscribe_task":
-        task_id = message.get("task_id")
-        if task_id:
-            connection_manager.unsubscribe_from_task(connection_id, task_id)
-            await connection_manager.send_personal_message(connection_id, {
-                "type": "unsubscription_confirmed",
-                "task_id": task_id
-            })
-    
-    elif message_type == "ping":
+async def _handle_subscribe_task(connection_id: str, user_id: int, message: Dict[str, Any]):
+    """订阅任务"""
+    task_id = message.get("task_id")
+    if task_id:
+        connection_manager.subscribe_to_task(connection_id, task_id)
         await connection_manager.send_personal_message(connection_id, {
-            "type": "pong",
-            "timestamp": asyncio.get_event_loop().time()
+            "type": "subscription_confirmed",
+            "task_id": task_id
         })
-    
-    elif message_type == "get_stats":
-        stats = connection_manager.get_connection_stats()
+
+
+async def _handle_unsubscribe_task(connection_id: str, user_id: int, message: Dict[str, Any]):
+    """取消订阅任务"""
+    task_id = message.get("task_id")
+    if task_id:
+        connection_manager.unsubscribe_from_task(connection_id, task_id)
         await connection_manager.send_personal_message(connection_id, {
-            "type": "stats",
-            "data": stats
+            "type": "unsubscription_confirmed",
+            "task_id": task_id
         })
+
+
+async def _handle_ping(connection_id: str, user_id: int, message: Dict[str, Any]):
+    """心跳"""
+    await connection_manager.send_personal_message(connection_id, {
+        "type": "pong",
+        "timestamp": time.monotonic()
+    })
+
+
+async def _handle_get_stats(connection_id: str, user_id: int, message: Dict[str, Any]):
+    """获取连接统计"""
+    stats = connection_manager.get_connection_stats()
+    await connection_manager.send_personal_message(connection_id, {
+        "type": "stats",
+        "data": stats
+    })
+
+
+# 消息类型 -> 处理函数
+WEBSOCKET_MESSAGE_HANDLERS = {
+    "subscribe_task": _handle_subscribe_task,
+    "unsubscribe_task": _handle_unsubscribe_task,
+    "ping": _handle_ping,
+    "get_stats": _handle_get_stats,
+}
+
+
+async def handle_websocket_message(connection_id: str, user_id: int, message: Dict[str, Any]):
+    """处理WebSocket消息"""
+    message_type = message.get("type")
+    handler = WEBSOCKET_MESSAGE_HANDLERS.get(message_type)
     
-    else:
+    if handler is None:
         logger.warning(
             "Unknown WebSocket message type",
             connection_id=connection_id,
             user_id=user_id,
             message_type=message_type
         )
+        return
+    
+    await handler(connection_id, user_id, message)
@@ -1,6 +1,10 @@
 """
 AdsPower Manager 主应用入口
 """
+import asyncio
+import os
+from importlib.util import find_spec
+
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -12,12 +16,14 @@ from slowapi.errors import RateLimitExceeded
 import structlog
 
 from app.core.config import settings
-from app.core.database import create_tables
+from app.core.database import async_engine, create_tables, prewarm_async_pool
 from app.api.auth import router as auth_router
 from app.api.profiles import router as profiles_router
 from app.api.rpa import router as rpa_router
 from app.api.tasks import router as tasks_router
 from app.api.websocket import router as websocket_router
+from app.services.adspower_client import adspower_client
+from app.services.task_scheduler import task_scheduler
 
 # 配置结构化日志
 structlog.configure(
@@ -57,11 +63,11 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# 添加CORS中间件
+# 添加CORS中间件（URL 类型会补上末尾的 "/"，而 Origin 头不带，需去掉）
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
+        allow_origins=[str(origin).rstrip("/") for origin in settings.BACKEND_CORS_ORIGINS],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
@@ -163,6 +169,17 @@ async def startup_event():
     create_tables()
     logger.info("Database tables created")
     
+    # 预热异步连接池
+    if not settings.TESTING:
+        try:
+            await prewarm_async_pool()
+            logger.info("Async database pool prewarmed")
+        except Exception as e:
+            logger.error("Failed to prewarm async database pool", error=str(e))
+    
+    # 启动任务调度器（托管任务执行并调度定时任务）
+    app.state.scheduler_task = asyncio.create_task(task_scheduler.run())
+    
     # 其他初始化操作
     logger.info("Application startup completed")
 
@@ -171,6 +188,30 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("Application shutting down")
+    
+    # 停止任务调度器，取消仍在执行的任务
+    app.state.scheduler_task.cancel()
+    try:
+        await app.state.scheduler_task
+    except asyncio.CancelledError:
+        pass
+    
+    # 释放AdsPower客户端的共享连接
+    await adspower_client.close()
+    
+    # 关闭异步数据库连接池
+    await async_engine.dispose()
+
+
+def server_backends() -> dict:
+    """选择可用的事件循环、HTTP解析器与WebSocket实现，未安装时回退到默认实现"""
+    return {
+        # uvloop 不支持 Windows
+        "loop": "uvloop" if find_spec("uvloop") else "asyncio",
+        "http": "httptools" if find_spec("httptools") else "h11",
+        # wsproto 为依赖项，缺失时回退到 uvicorn[standard] 自带的 websockets
+        "ws": "wsproto" if find_spec("wsproto") else "websockets",
+    }
 
 
 if __name__ == "__main__":
@@ -181,6 +222,10 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        # 热重载仅用于开发环境
+        reload=os.getenv("UVICORN_RELOAD", "0") == "1",
         log_level=settings.LOG_LEVEL.lower(),
+        **server_backends(),
+        # 启用WebSocket permessage-deflate，批量任务更新帧压缩效果明显
+        ws_per_message_deflate=True,
     )
@@ -0,0 +1,7 @@
+"""
+测试公共配置
+"""
+import os
+
+# 必须在导入 app 之前设置：数据库引擎改用 SQLite 内存库
+os.environ["TESTING"] = "true"
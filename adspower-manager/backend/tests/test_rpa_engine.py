@@ -0,0 +1,291 @@
+"""
+RPA执行引擎测试
+"""
+import asyncio
+from collections import ChainMap
+from datetime import datetime, time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import rpa_engine as engine_module
+from app.services.rpa_engine import (
+    CaptchaPoller,
+    RPAEngine,
+    RPAExecutionContext,
+    RPANodeError,
+    RPANodeHandler,
+    _CMP_OPS,
+    _compile_template,
+    _load_excel_rows,
+)
+
+
+def _flow(nodes, flow_id=1, version=1):
+    return SimpleNamespace(id=flow_id, version=version, nodes=nodes)
+
+
+def _node(node_type, **config):
+    return {"type": node_type, "config": config}
+
+
+class FailingHandler(RPANodeHandler):
+    """并发安全但总是失败的测试节点"""
+
+    __slots__ = ()
+
+    parallel_safe = True
+
+    def __init__(self):
+        super().__init__("fail")
+
+    async def execute(self, context, config):
+        raise ValueError("boom")
+
+
+@pytest.fixture
+def context(monkeypatch):
+    """不连接浏览器和WebSocket的执行上下文"""
+
+    async def notify_task_progress(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(engine_module.task_notifier, "notify_task_progress", notify_task_progress)
+
+    task = SimpleNamespace(id=1, variables={"name": "bob"}, update_progress=lambda progress, index=None: None)
+    profile = SimpleNamespace(id=1, name="p1", adspower_id="a1")
+    context = RPAExecutionContext(task, profile, _flow([]))
+    context.engine = RPAEngine()
+    return context
+
+
+class TestPartition:
+
+    def test_independent_parallel_nodes_share_a_group(self):
+        nodes = [
+            _node("slackWebhook", webhookUrl="u", message="hi"),
+            _node("slackWebhook", webhookUrl="u", message="${name}"),
+            _node("httpRequest", url="https://api/${name}", variable="a"),
+            _node("openai", apiKey="k", prompt="p", variable="b"),
+        ]
+        assert RPAEngine()._partition(nodes) == [[0, 1, 2, 3]]
+
+    def test_read_after_write_splits_group(self):
+        nodes = [
+            _node("httpRequest", url="https://api", variable="a"),
+            _node("slackWebhook", webhookUrl="u", message="${a}"),
+        ]
+        assert RPAEngine()._partition(nodes) == [[0], [1]]
+
+    def test_write_after_read_splits_group(self):
+        nodes = [
+            _node("slackWebhook", webhookUrl="u", message="${a}"),
+            _node("httpRequest", url="https://api", variable="a"),
+        ]
+        assert RPAEngine()._partition(nodes) == [[0], [1]]
+
+    def test_write_after_write_splits_group(self):
+        nodes = [
+            _node("httpRequest", url="https://api/1"),
+            _node("httpRequest", url="https://api/2"),
+        ]
+        assert RPAEngine()._partition(nodes) == [[0], [1]]
+
+    def test_browser_nodes_run_alone(self):
+        nodes = [
+            _node("slackWebhook", webhookUrl="u", message="hi"),
+            _node("setVariable", name="x", value="1"),
+            _node("slackWebhook", webhookUrl="u", message="hi"),
+            _node("slackWebhook", webhookUrl="u", message="hi"),
+        ]
+        assert RPAEngine()._partition(nodes) == [[0], [1], [2, 3]]
+
+
+class TestTemplate:
+
+    @pytest.mark.parametrize("text", ["${name}-${missing}", "${name}-${missing}-${not-identifier}"])
+    def test_missing_variables_keep_placeholder(self, text):
+        rendered = _compile_template(text)(ChainMap({}, {"name": "bob"}))
+        assert rendered == text.replace("${name}", "bob")
+
+    @pytest.mark.parametrize("text", ["${value}", "${value}${not-identifier}"])
+    def test_none_is_rendered_as_text(self, text):
+        rendered = _compile_template(text)({"value": None})
+        assert rendered.startswith("None")
+
+    @pytest.mark.parametrize("suffix", ["", " ${not-identifier}"])
+    def test_literal_braces_are_preserved(self, suffix):
+        text = "{x} ${name} {} {{y}} {0}" + suffix
+        rendered = _compile_template(text)({"name": "bob"})
+        assert rendered == "{x} bob {} {{y}} {0}" + suffix
+
+
+class TestPlanCache:
+
+    def test_plan_is_reused_for_same_version(self):
+        engine = RPAEngine()
+        flow = _flow([_node("slackWebhook", webhookUrl="u", message="hi")])
+
+        plan = engine._prepare_plan(flow)
+        flow.nodes = flow.nodes * 2
+        assert engine._prepare_plan(flow) is plan
+
+    def test_version_bump_invalidates_plan(self):
+        engine = RPAEngine()
+        flow = _flow([_node("slackWebhook", webhookUrl="u", message="hi")])
+        engine._prepare_plan(flow)
+
+        flow.nodes = [_node("setVariable", name="x", value="1"), _node("slackWebhook", webhookUrl="u", message="hi")]
+        flow.version += 1
+        steps, groups = engine._prepare_plan(flow)
+
+        assert [step[2] for step in steps] == ["setVariable", "slackWebhook"]
+        assert groups == [[0], [1]]
+
+    def test_registering_handler_invalidates_plans(self):
+        engine = RPAEngine()
+        flow = _flow([_node("slackWebhook", webhookUrl="u", message="hi")])
+        plan = engine._prepare_plan(flow)
+
+        engine.register_handler(FailingHandler())
+        assert engine._prepare_plan(flow) is not plan
+
+
+class TestParallelGroup:
+
+    @pytest.mark.asyncio
+    async def test_logs_are_attributed_to_each_node(self, context):
+        engine = context.engine
+        nodes = [
+            _node("slackWebhook", webhookUrl="u", message="hi", channel="#a"),
+            _node("slackWebhook", webhookUrl="u", message="hi", channel="#b"),
+        ]
+        steps, groups = engine._prepare_plan(_flow(nodes))
+        assert groups == [[0, 1]]
+
+        results = await engine.run_parallel_nodes(context, steps, groups[0])
+
+        assert all(result["success"] for result in results)
+        node_indexes = {entry["args"][0]: entry["node_index"] for entry in context.execution_logs}
+        assert node_indexes == {"#a": 0, "#b": 1}
+
+    @pytest.mark.asyncio
+    async def test_node_failure_raises_single_error(self, context):
+        engine = context.engine
+        engine.register_handler(FailingHandler())
+        nodes = [
+            _node("slackWebhook", webhookUrl="u", message="hi"),
+            _node("fail"),
+        ]
+        steps, groups = engine._prepare_plan(_flow(nodes))
+        assert groups == [[0, 1]]
+
+        with pytest.raises(RPANodeError) as exc_info:
+            await engine.run_parallel_nodes(context, steps, groups[0])
+
+        assert exc_info.value.node_index == 1
+        assert exc_info.value.node_type == "fail"
+
+
+class TestDrainLogs:
+
+    @pytest.mark.asyncio
+    async def test_batch_is_sent_as_one_notification(self, context, monkeypatch):
+        sent = []
+
+        async def notify_task_logs(task_id, entries):
+            sent.append([entry["message"] for entry in entries])
+
+        monkeypatch.setattr(engine_module.task_notifier, "notify_task_logs", notify_task_logs)
+        context.log_queue = asyncio.Queue()
+        for i in range(3):
+            context.add_log("info", "line %s", i)
+        context.log_queue.put_nowait(None)
+
+        await context.engine._drain_logs(context)
+
+        assert sent == [["line 0", "line 1", "line 2"]]
+
+    @pytest.mark.asyncio
+    async def test_notification_failure_does_not_stop_draining(self, context, monkeypatch):
+        async def notify_task_logs(task_id, entries):
+            raise RuntimeError("websocket down")
+
+        monkeypatch.setattr(engine_module.task_notifier, "notify_task_logs", notify_task_logs)
+        context.log_queue = asyncio.Queue()
+        context.add_log("info", "line")
+        context.log_queue.put_nowait(None)
+
+        await asyncio.wait_for(context.engine._drain_logs(context), timeout=1)
+
+
+class TestCaptchaPoller:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_solves_share_one_fetch(self):
+        poller = CaptchaPoller()
+        poller.POLL_INTERVAL = 0.01
+        fetch_results = poller._fetch_results
+        fetched = []
+
+        async def fetch(api_key, captcha_ids):
+            fetched.append(sorted(captcha_ids))
+            return await fetch_results(api_key, captcha_ids)
+
+        poller._fetch_results = fetch
+        tokens = await asyncio.gather(*(poller.solve("key", "site", "url") for _ in range(3)))
+
+        assert len(tokens) == 3 and all(tokens)
+        assert fetched == [["1", "2", "3"]]
+        assert poller._submitted_at == {}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_solve_is_forgotten(self, monkeypatch):
+        monkeypatch.setattr(engine_module, "_SIMULATE_DELAYS", True)
+        poller = CaptchaPoller()
+        poller.POLL_INTERVAL = 0.01
+        poller.SIMULATED_SOLVE_TIME = 60
+
+        solving = asyncio.create_task(poller.solve("key", "site", "url"))
+        await asyncio.sleep(0.03)
+        solving.cancel()
+        await asyncio.gather(solving, return_exceptions=True)
+
+        # 轮询器丢弃已取消的等待者后退出
+        await asyncio.wait_for(poller._task, timeout=1)
+        assert poller._pending == {}
+        assert poller._submitted_at == {}
+
+
+@pytest.mark.parametrize("operator, left, right, expected", [
+    ("equals", 5, "5", True),
+    ("not_equals", "a", "b", True),
+    ("contains", "hello", "ell", True),
+    ("greater_than", "10", 9, True),
+    ("less_than", "10", "9", False),
+    ("greater_than", "abc", 1, False),
+])
+def test_compare_operators(operator, left, right, expected):
+    assert _CMP_OPS[operator](left, right) is expected
+
+
+def test_tag_string_is_split_once_with_empty_tags_kept():
+    handler = RPAEngine().handlers["updateTag"]
+    config = handler.prepare_config({"tags": "a, b,,c"})
+    assert config["_tags_parsed"] == ["a", "b", "", "c"]
+
+
+def test_excel_rows_are_json_compatible(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "created", "at", None])
+    sheet.append(["bob", datetime(2024, 1, 2, 3, 4, 5), time(6, 7), 1])
+    sheet.append([None, None, None, None])
+    path = tmp_path / "data.xlsx"
+    workbook.save(path)
+
+    assert _load_excel_rows(str(path), "missing") == [
+        {"name": "bob", "created": "2024-01-02T03:04:05", "at": "06:07:00", "column_4": 1},
+    ]
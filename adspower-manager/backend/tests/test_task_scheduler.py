@@ -0,0 +1,164 @@
+"""
+任务调度器测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.task import Task
+from app.services.task_scheduler import TaskScheduler
+
+
+async def _start(scheduler: TaskScheduler) -> asyncio.Task:
+    """在后台运行调度器（不运行定时任务循环）"""
+    scheduler.schedule_periodic_tasks = asyncio.Event().wait
+    runner = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0)
+    return runner
+
+
+async def _stop(runner: asyncio.Task):
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+
+
+async def _create_tasks_table(rows: str):
+    """创建只含认领所需列的 tasks 表（完整表使用了 PostgreSQL 专有类型）"""
+    async with async_engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS tasks"))
+        await conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, status VARCHAR(20), updated_at TIMESTAMP)"))
+        await conn.execute(text(f"INSERT INTO tasks (id, status, updated_at) VALUES {rows}"))
+
+
+async def _task_statuses() -> dict:
+    async with AsyncSessionLocal() as db:
+        return dict((await db.execute(select(Task.id, Task.status))).all())
+
+
+@pytest.mark.asyncio
+async def test_task_failure_does_not_stop_scheduler():
+    scheduler = TaskScheduler()
+    release = asyncio.Event()
+    finished = []
+
+    async def run_task(task_id: int):
+        if task_id == 1:
+            raise RuntimeError("boom")
+        await release.wait()
+        finished.append(task_id)
+
+    scheduler._run_task = run_task
+    runner = await _start(scheduler)
+    try:
+        assert await scheduler.execute_task(1)
+        assert await scheduler.execute_task(2)
+        await asyncio.sleep(0.01)
+
+        # 失败的任务不能取消同组的其他任务，也不能使调度器退出
+        assert not runner.done()
+        assert scheduler.is_running
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert finished == [2]
+
+        assert await scheduler.execute_task(3)
+        await asyncio.sleep(0.01)
+        assert finished == [2, 3]
+    finally:
+        await _stop(runner)
+
+
+@pytest.mark.asyncio
+async def test_queued_tasks_are_not_reported_as_running():
+    scheduler = TaskScheduler()
+    scheduler._semaphore = asyncio.Semaphore(1)
+    release = asyncio.Event()
+
+    async def run_task(task_id: int):
+        await release.wait()
+
+    scheduler._run_task = run_task
+    runner = await _start(scheduler)
+    try:
+        assert await scheduler.execute_task(1)
+        assert await scheduler.execute_task(2)
+        assert not await scheduler.execute_task(1)
+        await asyncio.sleep(0.01)
+
+        assert scheduler.get_running_tasks() == [1]
+        assert scheduler.get_queued_tasks() == [2]
+        assert await scheduler.get_task_status(1) == "running"
+        assert await scheduler.get_task_status(2) == "queued"
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert scheduler.get_running_tasks() == []
+        assert scheduler.get_queued_tasks() == []
+    finally:
+        await _stop(runner)
+
+    # 调度器退出后不再接收执行请求
+    assert not scheduler.is_running
+    assert not await scheduler.execute_task(3)
+
+
+@pytest.mark.asyncio
+async def test_due_task_is_claimed_by_one_worker():
+    await _create_tasks_table("(1, 'pending', NULL), (2, 'cancelled', NULL)")
+
+    executed = []
+
+    async def execute_task(task_id: int) -> bool:
+        executed.append(task_id)
+        return True
+
+    # 两个工作进程都收到了同一批到期任务
+    workers = [TaskScheduler(), TaskScheduler()]
+    due_at = datetime.utcnow() - timedelta(seconds=1)
+    for worker in workers:
+        worker.execute_task = execute_task
+        worker._schedule(1, due_at)
+        worker._schedule(2, due_at)
+
+    for worker in workers:
+        await worker._run_due_tasks()
+
+    assert executed == [1]
+    assert await _task_statuses() == {1: "queued", 2: "cancelled"}
+
+
+@pytest.mark.asyncio
+async def test_rejected_claim_returns_to_pending():
+    await _create_tasks_table("(1, 'pending', NULL)")
+
+    # 调度器未运行，execute_task 拒绝执行
+    scheduler = TaskScheduler()
+    scheduler._schedule(1, datetime.utcnow() - timedelta(seconds=1))
+    await scheduler._run_due_tasks()
+
+    assert await _task_statuses() == {1: "pending"}
+
+
+@pytest.mark.asyncio
+async def test_stale_queued_claims_are_recovered():
+    await _create_tasks_table(
+        "(1, 'queued', datetime('now', '-1 hour')),"
+        " (2, 'queued', datetime('now')),"
+        " (3, 'queued', datetime('now', '-1 hour'))"
+    )
+
+    # 任务3仍在本进程排队，续约后不应被回收
+    scheduler = TaskScheduler()
+    waiting = asyncio.create_task(asyncio.Event().wait())
+    scheduler.running_tasks[3] = waiting
+    try:
+        await scheduler._recover_queued_tasks()
+        await scheduler._recover_queued_tasks()
+    finally:
+        waiting.cancel()
+
+    assert await _task_statuses() == {1: "pending", 2: "queued", 3: "queued"}
@@ -0,0 +1,75 @@
+"""
+WebSocket连接管理器测试
+"""
+import asyncio
+
+import orjson
+import pytest
+
+from app.services.websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+
+def _pending(manager: ConnectionManager, slot: int) -> list:
+    """取出槽位发送队列中的消息文本"""
+    queue = manager.send_queues[slot]
+    return [queue.get_nowait()[2] for _ in range(queue.qsize())]
+
+
+def test_full_queue_drops_oldest_droppable_message():
+    manager = ConnectionManager()
+    slot = manager._allocate_slot(FakeWebSocket(), asyncio.Queue(maxsize=3))
+
+    manager._enqueue(slot, "started")
+    manager._enqueue(slot, "progress-1", droppable=True)
+    manager._enqueue(slot, "progress-2", droppable=True)
+    manager._enqueue(slot, "progress-3", droppable=True)
+    manager._enqueue(slot, "completed")
+
+    assert _pending(manager, slot) == ["started", "progress-3", "completed"]
+    assert manager.dropped[slot] == 2
+
+
+def test_full_queue_of_critical_messages_drops_new_droppable():
+    manager = ConnectionManager()
+    slot = manager._allocate_slot(FakeWebSocket(), asyncio.Queue(maxsize=2))
+
+    manager._enqueue(slot, "started")
+    manager._enqueue(slot, "completed")
+    manager._enqueue(slot, "progress", droppable=True)
+
+    assert _pending(manager, slot) == ["started", "completed"]
+    assert manager.dropped[slot] == 1
+
+
+@pytest.mark.asyncio
+async def test_dropped_updates_are_reported_to_client():
+    manager = ConnectionManager()
+    manager.QUEUE_SIZE = 4
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "conn-1", user_id=1)
+    manager.subscribe_to_task("conn-1", 5)
+
+    for progress in range(10):
+        await manager.send_task_update(5, {"status": "progress", "progress": progress})
+    await manager.send_task_update(5, {"status": "completed"})
+    await asyncio.sleep(0.01)
+
+    frames = [orjson.loads(data) for data in websocket.sent]
+    batches = [frame for frame in frames if frame["type"] == "batch"]
+    assert sum(frame["dropped_since_last"] for frame in batches) > 0
+
+    items = [item for frame in batches for item in frame["items"]]
+    assert items[-1]["data"]["status"] == "completed"
+
+    manager.disconnect("conn-1", user_id=1)
@@ -46,58 +46,68 @@ export const useWebSocket = () => {
         message.success('实时连接已建立');
       };
 
+      const handleMessage = (data: any) => {
+        console.log('WebSocket message received:', data);
+
+        // 添加到消息历史
+        dispatch(addMessage({
+          type: data.type,
+          data: data,
+          timestamp: Date.now(),
+        }));
+
+        // 处理不同类型的消息
+        switch (data.type) {
+          case 'welcome':
+            dispatch(setConnectionId(data.connection_id));
+            break;
+
+          case 'task_update':
+            dispatch(addTaskUpdate({
+              taskId: data.task_id,
+              update: {
+                task_id: data.task_id,
+                status: data.data.status,
+                progress: data.data.progress,
+                current_node: data.data.current_node,
+                message: data.data.message,
+                error: data.data.error,
+                result: data.data.result,
+                log: data.data.log,
+              },
+            }));
+
+            // 显示任务状态通知
+            if (data.data.status === 'completed') {
+              message.success(`任务 ${data.task_id} 执行完成`);
+            } else if (data.data.status === 'failed') {
+              message.error(`任务 ${data.task_id} 执行失败: ${data.data.error}`);
+            }
+            break;
+
+          case 'system_notification':
+            message.info(data.data.message);
+            break;
+
+          case 'error':
+            message.error(data.message);
+            break;
+
+          default:
+            console.log('Unknown message type:', data.type);
+        }
+      };
+
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          console.log('WebSocket message received:', data);
-
-          // 添加到消息历史
-          dispatch(addMessage({
-            type: data.type,
-            data: data,
-            timestamp: Date.now(),
-          }));
-
-          // 处理不同类型的消息
-          switch (data.type) {
-            case 'welcome':
-              dispatch(setConnectionId(data.connection_id));
-              break;
-
-            case 'task_update':
-              dispatch(addTaskUpdate({
-                taskId: data.task_id,
-                update: {
-                  task_id: data.task_id,
-                  status: data.data.status,
-                  progress: data.data.progress,
-                  current_node: data.data.current_node,
-                  message: data.data.message,
-                  error: data.data.error,
-                  result: data.data.result,
-                  log: data.data.log,
-                },
-              }));
-
-              // 显示任务状态通知
-              if (data.data.status === 'completed') {
-                message.success(`任务 ${data.task_id} 执行完成`);
-              } else if (data.data.status === 'failed') {
-                message.error(`任务 ${data.task_id} 执行失败: ${data.data.error}`);
-              }
-              break;
-
-            case 'system_notification':
-              message.info(data.data.message);
-              break;
-
-            case 'error':
-              message.error(data.message);
-              break;
-
-            default:
-              console.log('Unknown message type:', data.type);
+          // 服务端会把积压的多条消息合并为一个 batch 帧
+          const items = data.type === 'batch' ? data.items : [data];
+          if (data.dropped_since_last) {
+            // 服务端发送队列溢出，部分进度/日志消息被丢弃
+            console.warn(`WebSocket dropped ${data.dropped_since_last} updates before seq ${data.last_seq}`);
           }
+          items.forEach(handleMessage);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
         }
@@ -78,8 +78,10 @@ export const taskService = {
    */
   async getRunningTasksStatus(): Promise<{
     running_count: number;
+    queued_count: number;
     max_concurrent: number;
     running_task_ids: number[];
+    queued_task_ids: number[];
   }> {
     return request.get('/tasks/running/status');
   },